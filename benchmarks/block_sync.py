@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""
+    Messages and bytes needed to serve a chain of N blocks to a syncing peer: one GET_BLOCK/BLOCK pair per block
+    compared with GET_BLOCKS ranges answered by BLOCKS messages (each fitting into a datagram), in both wire formats.
+
+    $ python3 ./benchmarks/block_sync.py [N [TXNS_PER_BLOCK]]
+"""
+
+import sys
+import time
+
+import util
+from strongchain.syncwindow import SyncWindow
+from strongchain.lib.nodeconfig import NodeConf
+from strongchain.wire import WireFormat
+from strongchain.lib.enums import MsgType
+
+
+def serve(node, peer, requests):
+    'Requests are (type, data); returns numbers of requests and replies, bytes of replies and the time of serving.'
+    replies = []
+    node._send_datagram = lambda datagram, p, msg_type: replies.append(datagram)
+
+    start = time.perf_counter()
+    for msg_type, data in requests:
+        node._handle_message({'type': msg_type, 'from': peer.vk, 'data': data})
+    elapsed = time.perf_counter() - start
+
+    return len(requests), len(replies), sum(len(r) for r in replies), elapsed
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_txns = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    util.enter_tmp_dir()
+    node = util.make_node(0, 1)
+    util.mine_chain(node, n_blocks, n_txns)
+    lengths = range(2, node.blockchain.tip_block.length + 1)
+
+    print("{} blocks with {} txns".format(n_blocks, n_txns))
+    print("{:<22} {:>10} {:>10} {:>12} {:>10}".format("", "requests", "replies", "sent", "time"))
+    for wire_format, name in [(WireFormat.JSON, "JSON"), (WireFormat.BINARY_V2, "binary")]:
+        peer = NodeConf(0, 'localhost', node.peers[0].vk, [wire_format] if wire_format else None)
+        node.peers[0].wire = peer.wire
+
+        per_block = [(MsgType.GET_BLOCK, length) for length in lengths]
+        ranges = [(MsgType.GET_BLOCKS, (length, SyncWindow.BATCH)) for length in lengths[::SyncWindow.BATCH]]
+        for label, requests in [("GET_BLOCK", per_block), ("GET_BLOCKS", ranges)]:
+            n_req, n_rep, n_bytes, elapsed = serve(node, peer, requests)
+            print("{:<22} {:>10} {:>10} {:>10.1f}kB {:>9.2f}s".format("{} ({}):".format(label, name), n_req, n_rep, n_bytes / 1e3, elapsed))
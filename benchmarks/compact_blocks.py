@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""
+    Size of a mined block relayed in full (STRONG_BLOCK_MINED) and as a compact block (COMPACT_BLOCK) in both wire
+    formats, and the time of rebuilding the compact block by a receiver holding all its weak headers and txns.
+
+    $ python3 ./benchmarks/compact_blocks.py [BLOCKS [TXNS_PER_BLOCK]]
+"""
+
+import sys
+import time
+
+import util
+from strongchain.compactblock import CompactBlock
+from strongchain.wire import WireFormat, encode_message, decode_message
+from strongchain.lib.enums import MsgType
+
+
+def msg_size(node, msg_type, data, wire_format):
+    return len(encode_message({'type': msg_type, 'from': node.pub_key, 'data': data}, wire_format))
+
+
+def rebuild(node, blocks):
+    'Decode each compact block and rebuild it from its own weak headers and txns; returns the time per block.'
+    msgs = [encode_message({'type': MsgType.COMPACT_BLOCK, 'from': node.pub_key, 'data': CompactBlock.from_block(b)},
+        WireFormat.BINARY_V2) for b in blocks
+    ]
+
+    start = time.perf_counter()
+    for msg, block in zip(msgs, blocks):
+        compact = decode_message(node, msg)['data']
+        compact.fill(block.weak_hdrs, block.txns)
+        assert compact.to_block(node) is not None
+    return (time.perf_counter() - start) / len(blocks)
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_txns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    util.enter_tmp_dir()
+    node = util.make_node(0, 1)
+    blocks = util.mine_chain(node, n_blocks, n_txns)[1:]
+    whdrs = sum(len(b.weak_hdrs) for b in blocks) / len(blocks)
+
+    print("{} blocks with {} txns and {:.1f} weak headers on average".format(n_blocks, n_txns, whdrs))
+    print("{:<10} {:>12} {:>12} {:>8}".format("", "full", "compact", "ratio"))
+    for wire_format, name in [(WireFormat.JSON, "JSON:"), (WireFormat.BINARY_V2, "binary:")]:
+        full = sum(msg_size(node, MsgType.STRONG_BLOCK_MINED, b, wire_format) for b in blocks) / len(blocks)
+        compact = sum(msg_size(node, MsgType.COMPACT_BLOCK, CompactBlock.from_block(b), wire_format) for b in blocks) / len(blocks)
+        print("{:<10} {:>8.0f} B/msg {:>6.0f} B/msg {:>7.1f}%".format(name, full, compact, 100 * compact / full))
+    print("rebuild: {:>8.1f} us/block".format(rebuild(node, blocks) * 1e6))
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+    Number of SHA-256 calls made by a node that syncs (decodes, validates and stores) a chain
+    and then serves it block by block to another peer, with cached and with recomputed
+    Header.hash / Transaction.hash.
+
+    $ python3 ./benchmarks/hash_calls.py [BLOCKS [TXNS_PER_BLOCK]]
+"""
+
+import sys
+import time
+import hashlib
+
+import util
+from strongchain import Block, Header, Transaction
+
+
+class CountingSha256:
+    def __init__(self):
+        self.calls = 0
+        self._sha256 = hashlib.sha256
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self._sha256(*args, **kwargs)
+
+
+def sync_and_serve(wire_blocks, node_id):
+    node = util.make_node(1, node_id)
+    for data in wire_blocks:
+        block = Block.from_json_str(node, data)
+        if not node._validate_recv_block(block):
+            raise RuntimeError("block[{}] is invalid".format(block.length))
+        node._add_recv_block(block)
+
+    for length in range(1, node.blockchain.tip_block.length + 1):
+        node.blockchain.get_block_by_length(length).to_json_str()
+    return node
+
+
+def run(wire_blocks, node_id):
+    counter = CountingSha256()
+    hashlib.sha256 = counter
+    try:
+        start = time.perf_counter()
+        sync_and_serve(wire_blocks, node_id)
+        return counter.calls, time.perf_counter() - start
+    finally:
+        hashlib.sha256 = counter._sha256
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_txns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    util.enter_tmp_dir()
+    miner = util.make_node(0, 1)
+    wire_blocks = [b.to_json_str() for b in util.mine_chain(miner, n_blocks, n_txns)[1:]]
+
+    cached_calls, cached_time = run(wire_blocks, 2)
+
+    cached_props = Header.hash, Transaction.hash
+    Header.hash = property(Header.compute_hash)
+    Transaction.hash = property(Transaction.compute_hash)
+    uncached_calls, uncached_time = run(wire_blocks, 3)
+    Header.hash, Transaction.hash = cached_props
+
+    print("sync + serve of {} blocks with {} txns each".format(n_blocks, n_txns))
+    print("{:<24} {:>10,d} SHA-256 calls {:>8.2f} s".format("recomputed hashes:", uncached_calls, uncached_time))
+    print("{:<24} {:>10,d} SHA-256 calls {:>8.2f} s".format("cached hashes:", cached_calls, cached_time))
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+"""
+    Hashrate of a single core: building a Header per nonce (as mining did before)
+    versus feeding just the nonce into a precomputed SHA-256 midstate (as Miner does).
+
+    $ python3 ./benchmarks/header_hashing.py [HASHES]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from strongchain import Header
+
+
+PREV_HASH = 'ab' * 32
+ROOT = 'cd' * 32
+WHDRS_HASH = 'ef' * 32
+COINBASE = '9ec3ae4d79ce1324441db8fa588c3beb4be14e982f319b5ec0bc05c1adf04483ba86b61ecd84130ca69296bdf9d9b478'
+TARGET = Header.INIT_STRONG_TARGET
+
+
+def bench_header_objects(n):
+    ts = str(time.time())
+    weak_target = TARGET << Header.WEAK_TARGET_POWER
+    found = 0
+
+    start = time.perf_counter()
+    for nonce in range(n):
+        h = Header(PREV_HASH, ts, nonce, ROOT, WHDRS_HASH, COINBASE, TARGET).hash
+        if int(h, 16) < weak_target:
+            found += 1
+    return n / (time.perf_counter() - start), found
+
+
+def bench_midstate(n):
+    ts = str(time.time())
+    weak_target = TARGET << Header.WEAK_TARGET_POWER
+    found = 0
+
+    start = time.perf_counter()
+    midstate = Header.midstate(PREV_HASH, ts, ROOT, WHDRS_HASH, COINBASE, TARGET)
+    for nonce in range(n):
+        h = midstate.copy()
+        h.update(b'%d' % nonce)
+        if int.from_bytes(h.digest(), 'big') < weak_target:
+            found += 1
+    return n / (time.perf_counter() - start), found
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+    before, _ = bench_header_objects(n)
+    after, _ = bench_midstate(n)
+
+    print("{:<28} {:>12,.0f} hashes/sec".format("Header object per nonce:", before))
+    print("{:<28} {:>12,.0f} hashes/sec".format("midstate + nonce suffix:", after))
+    print("{:<28} {:>12.2f}x".format("speedup:", after / before))
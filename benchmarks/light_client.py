@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""
+    Bandwidth, time and memory of syncing a chain by a full node (BLOCK messages, full validation)
+    and by a light node (HEADERS messages, validation of headers only), both in binary wire format.
+
+    $ python3 ./benchmarks/light_client.py [BLOCKS [TXNS_PER_BLOCK]]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import util
+from config import BASE_NODES
+from strongchain import LightNode
+from strongchain.wire import WireFormat, encode_message, decode_message
+from strongchain.lib.enums import LogLevel, MsgType
+
+
+def sync_full(source, node):
+    n_bytes = 0
+    for length in range(2, source.blockchain.tip_block.length + 1):
+        msg = encode_message({'type': MsgType.BLOCK, 'from': source.pub_key, 'data': source.blockchain.get_block_by_length(length)}, WireFormat.BINARY_V2)
+        n_bytes += len(msg)
+        block = decode_message(node, msg)['data']
+        if not node._validate_recv_block(block):
+            raise RuntimeError("block[{}] is invalid".format(block.length))
+        node._add_recv_block(block)
+    return n_bytes
+
+
+def sync_light(source, node):
+    n_bytes = 0
+    while True:
+        headers = source.blockchain.get_headers(node.blockchain.tip_block.length + 1)
+        msg = encode_message({'type': MsgType.HEADERS, 'from': source.pub_key, 'data': headers}, WireFormat.BINARY_V2)
+        n_bytes += len(msg)
+        if 0 == node._add_headers(decode_message(node, msg)['data']):
+            return n_bytes
+
+
+def measure(sync, source, node):
+    tracemalloc.start()
+    start = time.perf_counter()
+    n_bytes = sync(source, node)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert node.blockchain.tip_block.header.hash == source.blockchain.tip_block.header.hash
+    return n_bytes, elapsed, memory
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    n_txns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    util.enter_tmp_dir()
+    source = util.make_node(0, 1)
+    util.mine_chain(source, n_blocks, n_txns)
+
+    full = measure(sync_full, source, util.make_node(1, 2))
+    light = measure(sync_light, source, LightNode(3, BASE_NODES[2], util.BASE_SKS[2], peers=list(BASE_NODES), log_level=LogLevel.NONE))
+
+    print("{} blocks with {} txns".format(n_blocks, n_txns))
+    print("{:<8} {:>12} {:>12} {:>12}".format("", "received", "time", "memory"))
+    for name, (n_bytes, elapsed, memory) in [("full:", full), ("light:", light)]:
+        print("{:<8} {:>10.1f}kB {:>10.2f}s {:>10.1f}kB".format(name, n_bytes / 1e3, elapsed, memory / 1e3))
+    print("{:<8} {:>11.1%} {:>11.1%} {:>11.1%}".format("light/full:", *(l / f for l, f in zip(light, full))))
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""
+    Memory held by a chain of blocks that arrived from the network (decoded from JSON),
+    each with a number of weak headers. Compares strongchain's Header/Block with plain
+    __dict__-based objects that keep their own copy of every field.
+
+    $ python3 ./benchmarks/memory.py [BLOCKS [WEAK_HEADERS_PER_BLOCK]]
+"""
+
+import os
+import sys
+import json
+import hashlib
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from strongchain import Block, Header
+
+
+MINERS = [hashlib.sha384(str(i).encode()).hexdigest() for i in range(4)]
+
+
+class PlainHeader:
+    def __init__(self, prev_hash, timestamp, nonce, root, whdrs_hash, cb, target):
+        self.prev_hash = prev_hash
+        self.timestamp = float(timestamp)
+        self.nonce = int(nonce)
+        self.root = root
+        self.coinbase = cb
+        self.target = target
+        self.whdrs_hash = whdrs_hash
+
+
+class PlainBlock:
+    def __init__(self, node, header, length, txns, whdrs):
+        self.header = header
+        self.length = length
+        self.txns = txns
+        self.weak_hdrs = whdrs
+        self.node = node
+
+
+def header_json(prev_hash, i, cb):
+    h = hashlib.sha256(str(i).encode()).hexdigest()
+    return {'prev_hash': prev_hash, 'timestamp': 1542696180.0 + i, 'nonce': i, 'root': h, 'whdrs_hash': h,
+        'coinbase': cb, 'target': Header.INIT_STRONG_TARGET}
+
+
+def build_chain(header_cls, block_cls, n_blocks, n_whdrs):
+    chain = []
+    prev_hash = '0' * 64
+    for i in range(n_blocks):
+        # as if received from a peer: every field is a fresh object
+        j = json.loads(json.dumps({
+            'header': header_json(prev_hash, i, MINERS[i % len(MINERS)]),
+            'weak_hdrs': [header_json(prev_hash, i * 100 + k, MINERS[k % len(MINERS)]) for k in range(n_whdrs)],
+        }))
+        hdr = header_cls(*(j['header'][k] for k in ('prev_hash', 'timestamp', 'nonce', 'root', 'whdrs_hash', 'coinbase', 'target')))
+        whdrs = [header_cls(*(wh[k] for k in ('prev_hash', 'timestamp', 'nonce', 'root', 'whdrs_hash', 'coinbase', 'target')))
+            for wh in j['weak_hdrs']
+        ]
+        chain.append(block_cls(None, hdr, i + 1, [], whdrs))
+        prev_hash = hashlib.sha256(str(i).encode()).hexdigest()
+    return chain
+
+
+def measure(header_cls, block_cls, n_blocks, n_whdrs):
+    tracemalloc.start()
+    chain = build_chain(header_cls, block_cls, n_blocks, n_whdrs)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del chain
+    return size
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_whdrs = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    before = measure(PlainHeader, PlainBlock, n_blocks, n_whdrs)
+    after = measure(Header, Block, n_blocks, n_whdrs)
+
+    print("{} blocks with {} weak headers each".format(n_blocks, n_whdrs))
+    print("{:<24} {:>10.1f} MiB ({:>5.0f} B/block)".format("plain __dict__ objects:", before / 2**20, before / n_blocks))
+    print("{:<24} {:>10.1f} MiB ({:>5.0f} B/block)".format("Header/Block:", after / 2**20, after / n_blocks))
+    print("{:<24} {:>10.2f}x".format("reduction:", before / after))
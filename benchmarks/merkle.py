@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+"""
+    Merkle roots and proofs of MerkleTree (binary digests, cached levels) compared with the previous
+    implementation over hex strings (reproduced below), for a block with N txns:
+    building the tree, appending txns one by one (e.g., template refreshes), and serving all proofs.
+
+    $ python3 ./benchmarks/merkle.py [N]
+"""
+
+import os
+import sys
+import time
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from strongchain.merkletree import MerkleTree
+
+
+class HexMerkleTree:
+    'The previous implementation (hex digests, recursive build, add() rebuilds the whole tree).'
+
+    def __init__(self, leaves_list):
+        self.nodes = []
+        self.tree = []
+        self.proof_path = []
+        for leave in leaves_list:
+            self.nodes.append(single_hash(leave))
+        self.tree.append(self.nodes)
+        self.build(self.nodes)
+        self.root = self.get_root()
+
+    @classmethod
+    def compute_root(cls, leaves):
+        tree = cls(leaves)
+        return tree.root
+
+    def add(self, new_leave):
+        # Add entries to tree
+        self.nodes.append(single_hash(new_leave))
+        self.tree = []
+        self.tree.append(self.nodes)
+        self.build(self.nodes)
+        self.root = self.get_root()
+
+    def build(self, start_list):
+        # Build tree computing new root
+        if 0 == len(start_list):
+            return '0' * 64
+
+        end_list = []
+        if len(start_list) > 1:
+            if len(start_list) % 2 == 0:
+                for i in range(0, len(start_list), 2):
+                    end_list.append(double_hash(start_list[i], start_list[i + 1]))
+            else:
+                for i in range(0, len(start_list) - 1, 2):
+                    end_list.append(double_hash(start_list[i], start_list[i + 1]))
+                end_list.append(start_list[-1])
+            self.tree.append(end_list)
+            return self.build(end_list)
+
+        else:
+            if len(self.tree) == 0:
+                end_list.append(start_list[0])
+                self.tree.append(end_list)
+                return start_list[0]
+
+    def get_proof(self, entry):
+        self.proof_path = []
+        if int(entry) > len(self.nodes) - 1:
+            return []
+
+        else:
+            next_entry = entry
+            for i in range(0, len(self.tree) - 1):
+                if len(self.tree[i]) != 1:
+                    if int(next_entry) % 2 == 0:
+                        if int(next_entry) != len(self.tree[i]) - 1:
+                            self.proof_path.append([self.tree[i][int(next_entry) + 1], 'r'])
+                    else:
+                        self.proof_path.append([self.tree[i][int(next_entry) - 1], 'l'])
+                next_entry = get_next_entry(next_entry)
+            return self.proof_path
+
+    def get_root(self):
+
+        # Return the current root
+        if 0 == len(self.tree[-1]):
+            return '0' * 64
+
+        return str(self.tree[-1][0])
+
+
+def single_hash(value):
+
+    if not isinstance(value, str):
+        value = str(value)
+
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def double_hash(node1, node2):
+    return hashlib.sha256((node1 + node2).encode()).hexdigest()
+
+
+def get_next_entry(value):
+    if value <= 1:
+        return 0
+    else:
+        if value % 2 == 0:
+            return int(value / 2)
+        else:
+            return int((value - 1) / 2)
+
+
+def measure(tree_cls, leaves):
+    start = time.perf_counter()
+    tree = tree_cls(leaves)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    inc_tree = tree_cls([])
+    for leaf in leaves:
+        inc_tree.add(leaf)
+    add_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    proofs = [list(tree.get_proof(i)) for i in range(len(leaves))]
+    proof_time = time.perf_counter() - start
+
+    assert tree.get_root() == inc_tree.get_root()
+    return tree.get_root(), proofs, build_time, add_time, proof_time
+
+
+if __name__ == "__main__":
+    n_leaves = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    leaves = ['{{"sender": "{}", "amount": {}}}'.format(i, i) for i in range(n_leaves)]
+
+    hex_root, hex_proofs, *hex_times = measure(HexMerkleTree, leaves)
+    root, proofs, *times = measure(MerkleTree, leaves)
+    assert root == hex_root and proofs == hex_proofs, "roots or proofs differ"
+
+    print("{} leaves, same roots and proofs".format(n_leaves))
+    print("{:<10} {:>12} {:>14} {:>14}".format("", "build", "append all", "all proofs"))
+    print("{:<10} {:>10.2f}ms {:>12.2f}ms {:>12.2f}ms".format("hex:", *(t * 1e3 for t in hex_times)))
+    print("{:<10} {:>10.2f}ms {:>12.2f}ms {:>12.2f}ms".format("binary:", *(t * 1e3 for t in times)))
+    print("{:<10} {:>11.2f}x {:>13.2f}x {:>13.2f}x".format("ratio:", *(h / t for h, t in zip(hex_times, times))))
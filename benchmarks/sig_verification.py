@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+"""
+    Latency of validating a received block with many txns, with signatures verified
+    one by one in the validating thread, in a pool of WORKERS processes, and with all
+    signatures already in the cache of verified signatures (e.g., txns seen as pending).
+
+    $ python3 ./benchmarks/sig_verification.py [TXNS_PER_BLOCK [WORKERS]]
+"""
+
+import os
+import sys
+import time
+
+import util
+from strongchain import Block, Transaction
+from strongchain.sigverifier import SigVerifier
+from strongchain.lib.lrucache import LRUCache
+
+
+def measure(node, block, cached=False, rounds=5):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if not cached:
+            node.sig_verifier.cache = LRUCache(SigVerifier.CACHE_SIZE)
+        if not node._validate_recv_block(block):
+            raise RuntimeError("block[{}] is invalid".format(block.length))
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    n_txns = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    util.enter_tmp_dir()
+    miner = util.make_node(0, 1)
+    util.mine_chain(miner, 10) # rewards to fund txns
+
+    # a peer that received all blocks and has added all except the last one
+    node = util.make_node(1, 2)
+    blocks = [Block.from_bytes(node, b.to_bytes()) for b in util.mine_chain(miner, 1, n_txns)]
+    for b in blocks[1:-1]:
+        node._add_recv_block(b)
+
+    serial_time = measure(node, blocks[-1])
+
+    node.sig_verifier = SigVerifier(n_workers)
+    node.sig_verifier.start()
+    node.sig_verifier.verify(blocks[-1].txns) # wait until workers are up
+    pool_time = measure(node, blocks[-1])
+    cached_time = measure(node, blocks[-1], cached=True)
+    node.sig_verifier.shutdown()
+
+    print("block with {} txns, {} workers".format(len(blocks[-1].txns), n_workers))
+    print("{:<10} {:>8.1f} ms/block".format("serial:", serial_time * 1e3))
+    print("{:<10} {:>8.1f} ms/block {:>8.2f}x".format("pool:", pool_time * 1e3, serial_time / pool_time))
+    print("{:<10} {:>8.1f} ms/block {:>8.2f}x".format("cached:", cached_time * 1e3, serial_time / cached_time))
+    print("signature cache: {}".format(node.sig_verifier.cache))
+    print("key cache:       {}".format(Transaction.VK_CACHE))
@@ -0,0 +1,88 @@
+"""
+    Helpers of benchmarks: nodes running in a temporary directory and a quickly mined valid chain.
+"""
+
+import os
+import sys
+import time
+import ecdsa
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from config import BASE_NODES
+from strongchain import Block, Blockchain, Header, Node, Transaction
+from strongchain.lib.enums import LogLevel
+
+
+# secret keys of BASE_NODES (see BaseNode*.py)
+BASE_SKS = [
+    '5a121ad3216b4a529bc3856e8471d21a6f400af81d3b4ade',
+    'd1c600fc112f4f10af250c0eea653182ecbcb3711abef5e0',
+    '982398a6548a7a30b735c531bf0be344db9f1c9be1a1f501',
+]
+
+# make blocks cheap to mine, so benchmarks can build long chains
+Header.INIT_STRONG_TARGET = Header.MAX_TARGET
+
+
+def enter_tmp_dir():
+    'Nodes write logs and block stores relative to the working directory.'
+    path = tempfile.mkdtemp(prefix='strongchain-bench-')
+    os.makedirs(os.path.join(path, Node.LOG_DIR))
+    os.chdir(path)
+    return path
+
+
+def make_node(idx, node_id, node_cls=Node):
+    return node_cls(node_id, BASE_NODES[idx], BASE_SKS[idx], peers=[p for p in BASE_NODES if p is not BASE_NODES[idx]],
+        log_level=LogLevel.NONE, mining_workers=1, fresh_store=True
+    )
+
+
+def sign(tx, sk):
+    tx.signature = ecdsa.SigningKey.from_string(bytes.fromhex(sk), curve=ecdsa.NIST192p).sign(tx.hash.encode('utf-8')).hex()
+    return tx
+
+
+def mine_chain(node, n_blocks, txns_per_block=0, amount=0.01):
+    """
+        Extend the mainchain of node by n_blocks (in this process). Blocks include txns from node
+        to other base nodes as soon as node has funds. Timestamps are spaced by TIME_BETWEEN_BLOCKS,
+        so the strong target does not change.
+    """
+    bc = node.blockchain
+    idx = [n.vk for n in BASE_NODES].index(node.pub_key)
+    receivers = [n.vk for n in BASE_NODES if n.vk != node.pub_key]
+
+    for _ in range(n_blocks):
+        prev = bc.tip_block
+        txns = []
+        if node.bm.balances[node.pub_key] >= txns_per_block * amount:
+            txns = [sign(Transaction(node.pub_key, receivers[i % len(receivers)], amount, None, '{}-{}'.format(prev.length, i)),
+                BASE_SKS[idx]) for i in range(txns_per_block)
+            ]
+
+        root = Block(node, None, 0, txns).generate_root_hash(txns)
+        ts = time.time() if prev.length == Blockchain.GENESIS_LEN else prev.get_ts() + Blockchain.TIME_BETWEEN_BLOCKS
+        target = bc.get_next_strong_target(prev, LogLevel.NONE)
+
+        whdrs = []
+        whdrs_hash = Blockchain.EMPTY_WHDRS_HASH
+        nonce = 0
+        while True:
+            hdr = Header(prev.header.hash, ts, nonce, root, whdrs_hash, node.pub_key, target)
+            h = int(hdr.hash, 16)
+            if h < target:
+                break
+            if h < hdr.weak_target:
+                whdrs.append(hdr)
+                whdrs_hash = Blockchain.extend_whdrs_hash(whdrs_hash, hdr.hash)
+            nonce += 1
+
+        block = Block(node, hdr, prev.length + 1, txns, whdrs)
+        bc.add_block(block)
+        bc.tip_block = block
+        node.bm.update_balances(block)
+
+    return bc.get_mainchain()
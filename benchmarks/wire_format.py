@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+"""
+    Size and decoding time of STRONG_BLOCK_MINED messages in JSON and in binary wire formats (BINARY_V2 sends
+    weak headers without the fields shared with their block).
+
+    $ python3 ./benchmarks/wire_format.py [BLOCKS [TXNS_PER_BLOCK]]
+"""
+
+import sys
+import time
+
+import util
+from strongchain.wire import WireFormat, encode_message, decode_message
+from strongchain.lib.enums import MsgType
+
+
+def measure(node, blocks, wire_format):
+    msgs = [encode_message({'type': MsgType.STRONG_BLOCK_MINED, 'from': node.pub_key, 'data': b}, wire_format) for b in blocks]
+
+    start = time.perf_counter()
+    for m in msgs:
+        decode_message(node, m)
+    return sum(len(m) for m in msgs) / len(msgs), (time.perf_counter() - start) / len(msgs)
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_txns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    util.enter_tmp_dir()
+    node = util.make_node(0, 1)
+    blocks = util.mine_chain(node, n_blocks, n_txns)[1:]
+    whdrs = sum(len(b.weak_hdrs) for b in blocks) / len(blocks)
+
+    json_size, json_time = measure(node, blocks, WireFormat.JSON)
+    v1_size, v1_time = measure(node, blocks, WireFormat.BINARY_V1)
+    bin_size, bin_time = measure(node, blocks, WireFormat.BINARY_V2)
+
+    print("{} blocks with {} txns and {:.1f} weak headers on average".format(n_blocks, n_txns, whdrs))
+    print("{:<10} {:>8.0f} B/msg {:>8.1f} us/decode".format("JSON:", json_size, json_time * 1e6))
+    print("{:<10} {:>8.0f} B/msg {:>8.1f} us/decode".format("binary v1:", v1_size, v1_time * 1e6))
+    print("{:<10} {:>8.0f} B/msg {:>8.1f} us/decode".format("binary v2:", bin_size, bin_time * 1e6))
+    print("{:<10} {:>8.2f}x {:>12.2f}x".format("ratio:", json_size / bin_size, json_time / bin_time))
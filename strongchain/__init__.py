@@ -6,10 +6,11 @@ from .client import Client
 from .merkletree import MerkleTree
 from .node import Node
 from .selfishnode import SelfishNode
+from .lightnode import LightNode
 from .nodecontroller import NodeController
 from .transaction import Transaction
 from .lib.nodeconfig import NodeConf
 from .lib.argparser import ArgParser
 
 
-__all__ = ['Header', 'Block', 'Blockchain', 'Client', 'MerkleTree', 'Node', 'SelfishNode', 'NodeController', 'Transaction', 'NodeConf', 'ArgParser']
\ No newline at end of file
+__all__ = ['Header', 'Block', 'Blockchain', 'Client', 'MerkleTree', 'Node', 'SelfishNode', 'LightNode', 'NodeController', 'Transaction', 'NodeConf', 'ArgParser']
\ No newline at end of file
@@ -6,17 +6,22 @@ from .merkletree import MerkleTree
 from .lib.enums import LogLevel
 from .transaction import Transaction
 from .header import Header
+from .lib.binary import BinaryReader, BinaryWriter
 
 
 class Block():
 
+    __slots__ = ('header', 'length', 'txns', 'weak_hdrs', 'node', 'chain_pow', 'balance_deltas')
+
     def __init__(self, node, header, length, txns = [], whdrs = []):
         self.header = header
 
         self.length = length
         self.txns = txns
-        self.weak_hdrs = whdrs # set of Header objects
+        self.weak_hdrs = list(whdrs) # Header objects (a copy, so a view of the miner's cache is not kept alive)
         self.node = node # for logging purposes (not part of block)
+        self.chain_pow = None # PoW of the chain ending with this block, set when stored (not part of block)
+        self.balance_deltas = None # undo record: account IDs and changes of their balances caused by this block (not part of block)
 
 
     def generate_root_hash(self, items):
@@ -72,11 +77,16 @@ class Block():
         )
 
 
-    def to_json(self):
+    def complete_header(self):
+        'Fill in roots of txns and weak headers if they are missing.'
         if not self.header.root:
             self.header.root = self.generate_root_hash(self.txns)
         if not self.header.whdrs_hash:
-            self.header.whdrs_hash = self.node.blockchain.compute_hash_of_set(self.weak_hdrs)
+            self.header.whdrs_hash = self.node.blockchain.compute_whdrs_hash(self.weak_hdrs)
+
+
+    def to_json(self):
+        self.complete_header()
 
         return {
             "header" : self.header.to_json(),
@@ -90,12 +100,47 @@ class Block():
         return json.dumps(self.to_json(), indent=4)
 
 
+    def write_to(self, w, delta_whdrs=True):
+        """
+            Header, length and varint counts followed by txns and weak headers. Weak headers share prev_hash
+            and target with the header, so they are written without them (unless delta_whdrs is False).
+        """
+        self.complete_header()
+        self.header.write_to(w).varint(self.length).varint(len(self.txns))
+        for tx in self.txns:
+            tx.write_to(w)
+        w.varint(len(self.weak_hdrs))
+        for wh in self.weak_hdrs:
+            wh.write_delta_to(w) if delta_whdrs else wh.write_to(w)
+        return w
+
+
+    def to_bytes(self, delta_whdrs=True):
+        return self.write_to(BinaryWriter(), delta_whdrs).to_bytes()
+
+
     @classmethod
     def from_json_str(cls, node, json_string):
         j = json.loads(json_string)
         return Block.from_json(node, j)
 
 
+    @classmethod
+    def read_from(cls, node, r, delta_whdrs=True):
+        header, length = Header.read_from(r), r.varint()
+        txns = [Transaction.read_from(r) for _ in range(r.varint())]
+        if delta_whdrs:
+            whdrs = [Header.read_delta_from(r, header.prev_hash, header.target) for _ in range(r.varint())]
+        else:
+            whdrs = [Header.read_from(r) for _ in range(r.varint())]
+        return cls(node, header, length, txns, whdrs)
+
+
+    @classmethod
+    def from_bytes(cls, node, data, delta_whdrs=True):
+        return cls.read_from(node, BinaryReader(data), delta_whdrs)
+
+
     @classmethod
     def from_json(cls, node, j):
         return cls(node,  Header.from_json(j.get("header")), j.get("length"),
@@ -1,14 +1,16 @@
 import copy
 import datetime
 import hashlib
-import random
 import time
+import numpy as np
 from numpy import mean, std
 
 from .block import Block
 from .header import Header
+from .ledger import AccountRegistry, Ledger
 from .merkletree import MerkleTree
-from .transaction import Transaction
+from .txproof import TxProof
+from .snapshots import Snapshots
 from .lib.enums import LogLevel, MsgType, BlockValidationStatus as BlkValStatus
 
 class Blockchain:
@@ -26,13 +28,28 @@ class Blockchain:
 
     TIMESTAMP_RANGE = 3600
 
-    def __init__(self, node):
+    EMPTY_WHDRS_HASH = 64 * '0'
+
+    MINING_POLL_INTERVAL = 0.01 # how long the mining thread waits on results of mining processes
+    TEMPLATE_REFRESH_INTERVAL = 0.5 # how often (at most) txns of the mined block are updated from the mempool
+    MAX_HEADERS_PER_MSG = 64 # strong and weak headers sent in one HEADERS message
+    MAX_FUTURE_WHDRS = 64 # received weak headers kept until their parent block arrives
+
+    def __init__(self, node, store=None, snapshots=None):
         self.node = node
+        self.store = store # BlockStore persisting accepted blocks (if any)
+        self.snapshots = snapshots if snapshots else Snapshots() # periodic snapshots of balances
+        self.accounts = AccountRegistry() # IDs of addresses used by ledgers and undo records of blocks
         self.all_blocks = {}
         self.whdrs_cache = {} # hash => Header() // serves just for mining
+        self.whdrs_hash = Blockchain.EMPTY_WHDRS_HASH # commitment to whdrs_cache (in insertion order)
+        self.future_whdrs = [] # received weak headers whose parent block has not arrived yet
+        self.template_time = None # when txns of the currently mined block were last synchronized with the mempool
         self.times_of_blocks = [] # it is just an estimation; considers only blocks created since begining of this node
+        self.mainchain_hashes = [] # hashes of mainchain blocks, indexed by length - 1
+        self.mainchain_txns = {} # tx hash => (block hash, length) for txns of mainchain blocks
+        self.best_tip = None # tip with the highest chain PoW
         self.tip_block = self._add_genesis_block()
-        random.seed(node.get_log_filename())
 
         self.node.log("[Blockchain]: Ratio of weak/strong targets is {}".format(pow(2, Header.WEAK_TARGET_POWER)))
         self.node.log("[Blockchain]: Desired time between blocks is {}".format(Blockchain.TIME_BETWEEN_BLOCKS))
@@ -41,10 +58,75 @@ class Blockchain:
         self.node.log("", True)
 
 
+    @property
+    def tip_block(self):
+        return self._tip_block
+
+
+    @tip_block.setter
+    def tip_block(self, block):
+        """
+            Switch tip of mainchain; height and txns indices are rewritten only along the segment not shared with the old
+            mainchain. The listening thread reads mainchain_hashes meanwhile, so it is only appended to in place; a fork
+            switch builds a new list.
+        """
+        new_segment = []
+        cur_block = block
+        while not self.is_in_mainchain(cur_block):
+            new_segment.append(cur_block)
+            if cur_block.header.prev_hash == Blockchain.GENESIS_PREV_HASH:
+                break
+            cur_block = self.all_blocks[cur_block.header.prev_hash]
+
+        # drop txns of abandoned blocks
+        fork_len = new_segment[-1].length - 1 if new_segment else block.length
+        for h in self.mainchain_hashes[fork_len:]:
+            for tx in self.all_blocks[h].txns:
+                if self.mainchain_txns.get(tx.hash, (None,))[0] == h:
+                    del self.mainchain_txns[tx.hash]
+
+        hashes = self.mainchain_hashes
+        if fork_len < len(hashes):
+            hashes = hashes[:fork_len]
+        for b in reversed(new_segment):
+            hashes.append(b.header.hash)
+            for tx in b.txns:
+                self.mainchain_txns[tx.hash] = (b.header.hash, b.length)
+        self.mainchain_hashes = hashes
+
+        self._tip_block = block
+
+
     def add_block(self, block):
         self.times_of_blocks.append(time.time())
+        self._index_block(block)
+
+        if self.store and block.length > Blockchain.GENESIS_LEN:
+            self.store.append(block)
+
+
+    def restore(self):
+        'Load blocks persisted by previous runs and switch to the strongest restored chain. Returns the number of restored blocks.'
+        restored = 0
+
+        for block in self.store.load(self.node) if self.store else []:
+            if block.header.hash in self.all_blocks or not block.header.prev_hash in self.all_blocks:
+                continue
+            self._index_block(block)
+            restored += 1
+
+        if restored:
+            self.tip_block = self.best_tip
+        return restored
+
+
+    def _index_block(self, block):
+        block.chain_pow = self.chainPoW(block)
         self.all_blocks[block.header.hash] = block
 
+        if self.best_tip is None or block.chain_pow > self.best_tip.chain_pow:
+            self.best_tip = block
+
 
     def _add_genesis_block(self):
         txns = []
@@ -73,12 +155,11 @@ class Blockchain:
             return BlkValStatus.NON_EXISTING_PRED
 
         # check integrity of txns
-        tree = MerkleTree(block.txns)
-        if block.header.root != tree.get_root():
+        if not self.check_txns_integrity(block):
             return BlkValStatus.TXNS_INTEGRITY
 
         # check integrity of whdrs
-        if block.header.whdrs_hash != self.compute_hash_of_set(block.weak_hdrs):
+        if block.header.whdrs_hash != self.compute_whdrs_hash(block.weak_hdrs):
             return BlkValStatus.WHDRS_INTEGRITY
 
         # check strong target
@@ -104,6 +185,10 @@ class Blockchain:
         return BlkValStatus.OK
 
 
+    def check_txns_integrity(self, block):
+        return block.header.root == MerkleTree(block.txns).get_root()
+
+
     def validate_weak_header(self, wh, parent_hdr):
 
         # weak targets
@@ -128,20 +213,14 @@ class Blockchain:
     def chainPoW(self, block=None):
         """
             If block is None, then use tip_block of mainchain.
-            TODO: It could be more optimal and go until fork only. Now it goes until genesis.
+            Stored blocks carry PoW of their chain (computed once in add_block), so this is constant time.
         """
-        cur_pow = 0
-        cur_hash = block.header.hash if block else self.tip_block.header.hash
+        block = block if block else self.tip_block
+        if block.chain_pow is not None:
+            return block.chain_pow
 
-        if not cur_hash in self.all_blocks.keys():
-            return block.PoW()
-
-        while cur_hash != self.GENESIS_PREV_HASH:
-            cur_block = self.all_blocks[cur_hash]
-            cur_pow += cur_block.PoW()
-            cur_hash = cur_block.header.prev_hash
-
-        return cur_pow
+        parent = self.all_blocks.get(block.header.prev_hash)
+        return (parent.chain_pow if parent else 0) + block.PoW()
 
 
     def current_whdrs_PoW(self):
@@ -182,108 +261,261 @@ class Blockchain:
             return prev_block.header.target # just inherit target from the previous block
 
 
-    def get_balance(self, address):
-        'This is should be called only when a new node starts, as it is expensive.'
+    def get_balance(self, address, length=None):
+        'Balance of address after mainchain block with the given length (default is tip). Replays blocks after the nearest snapshot.'
 
-        blk = self.tip_block
-        total_funds = 0
+        blk = self.get_block_by_length(length) if length else self.tip_block
+        snapshot, blocks_after = self.snapshots.find(self, blk)
+        if snapshot is None:
+            blocks_after = self.get_mainchain(Blockchain.GENESIS_LEN + 1)[:blk.length - Blockchain.GENESIS_LEN]
 
-        while blk.header.prev_hash != self.GENESIS_PREV_HASH:
-            # incomming txns
-            for incomming_txn in (tx for tx in blk.txns if tx.receiver == address):
-                total_funds += incomming_txn.amount
+        account_id = self.accounts.ids.get(address)
+        total_units = snapshot.get_units(address) if snapshot else 0
+        for b in blocks_after:
+            ids, amounts = self.get_balance_deltas(b)
+            total_units += int(amounts[ids == account_id].sum())
 
-            # outgoing txns
-            for outgoing_txn in (tx for tx in blk.txns if tx.sender == address):
-                total_funds -= outgoing_txn.amount
+        return Ledger.from_units(total_units)
 
-            # rewards for strong block
-            if blk.header.coinbase == address:
-                total_funds += self.STRONG_BLOCK_REWARD
 
-            # rewards for weak headers
-            whdrs = [wh for wh in blk.weak_hdrs if wh.coinbase == address]
-            total_funds += blk.header.compute_whdr_reward(Blockchain.STRONG_BLOCK_REWARD) * len(whdrs)
+    def get_balance_deltas(self, block):
+        """
+            Undo record of block: vectors of distinct account IDs and changes of their balances (in Ledger units)
+            by txns and rewards of block. It is computed once per block.
+        """
+        if block.balance_deltas is None:
+            deltas = {}
+            get_id = self.accounts.get_id
+            for tx in block.txns:
+                amount = Ledger.to_units(tx.amount)
+                sender, receiver = get_id(tx.sender), get_id(tx.receiver)
+                deltas[sender] = deltas.get(sender, 0) - amount
+                deltas[receiver] = deltas.get(receiver, 0) + amount
+
+            # rewards for strong block and weak headers
+            coinbase = get_id(block.header.coinbase)
+            deltas[coinbase] = deltas.get(coinbase, 0) + Ledger.to_units(Blockchain.STRONG_BLOCK_REWARD)
+            for whdr in block.weak_hdrs:
+                coinbase = get_id(whdr.coinbase)
+                deltas[coinbase] = deltas.get(coinbase, 0) + Ledger.to_units(whdr.compute_whdr_reward(Blockchain.STRONG_BLOCK_REWARD))
+
+            block.balance_deltas = (
+                np.fromiter(deltas.keys(), dtype=np.int64, count=len(deltas)),
+                np.fromiter(deltas.values(), dtype=np.int64, count=len(deltas))
+            )
+
+        return block.balance_deltas
+
+
+    def get_fork_path(self, from_block, to_block):
+        """
+            Blocks to revert (from from_block back to the common ancestor) and blocks to apply (from the common ancestor
+            to to_block, in this order) when switching between the two chains. Walks only the divergent parts.
+        """
+        to_revert, to_apply = [], []
 
-            blk = self.all_blocks[blk.header.prev_hash]
+        while from_block.length > to_block.length:
+            to_revert.append(from_block)
+            from_block = self.all_blocks[from_block.header.prev_hash]
 
-        return total_funds
+        while to_block.length > from_block.length:
+            to_apply.append(to_block)
+            to_block = self.all_blocks[to_block.header.prev_hash]
 
+        while from_block.header.hash != to_block.header.hash:
+            to_revert.append(from_block)
+            to_apply.append(to_block)
+            from_block = self.all_blocks[from_block.header.prev_hash]
+            to_block = self.all_blocks[to_block.header.prev_hash]
 
-    def mine_next_block(self, coinbase, txns, stop_event, broadcast_whdrs=True):
+        return to_revert, to_apply[::-1]
 
-        root = MerkleTree.compute_root(txns) # txns root
+
+    def mine_next_block(self, coinbase, mempool, stop_event, broadcast_whdrs=True):
+        """
+            Mine a block with txns of the mempool. While mining, new txns are added to the mempool and the template
+            (txns and their root) is rebuilt whenever the mempool changes, at most every TEMPLATE_REFRESH_INTERVAL.
+            Weak headers do not commit to txns, so the collected ones are kept.
+        """
+        txns, mempool_version = mempool.get_txns(), mempool.version
+        tree = MerkleTree(txns)
+        root = tree.get_root() # txns root
+        self.template_time = time.time()
         ts = str(time.time())
         prev_hash = self.tip_block.header.hash
-        whdrs_hash = self.compute_hash_of_set(self.whdrs_cache.values())
+        whdrs_hash = self.whdrs_hash
         strong_target = self.get_next_strong_target(self.tip_block)
+        template_hdr = Header(prev_hash, ts, 0, root, whdrs_hash, coinbase, strong_target)
+
+        miner = self.node.miner
+        miner.set_job(prev_hash, ts, root, whdrs_hash, coinbase, strong_target)
+        try:
+            while not stop_event.is_set():
+
+                result = miner.get_result(Blockchain.MINING_POLL_INTERVAL)
+                if result is not None:
+                    nonce, h = result
+                    new_header = Header(prev_hash, ts, nonce, root, whdrs_hash, coinbase, strong_target)
+
+                    if int(h, 16) < new_header.target:
+                        self.node.log(66 * '+')
+                        self.node.log(20 * '+' + " Mined a new strong block " + 20 * '+')
+                        self.node.log(66 * '+')
+                        self.node.log("Template with {} txns was {:.2f}s old".format(len(txns), self.get_template_age()), True)
+                        new_block =  Block(self.node, new_header, self.tip_block.length + 1,
+                            list(txns), self.whdrs_cache.values()
+                        )
+                        new_block.print_block_info()
+                        self.clear_whdrs_cache()
+                        return new_block
+
+                    if not h in self.whdrs_cache:
+                        self.add_whdr(h, new_header)
+                        self.node.log(20 * '+' + " Mined a new weak header " + 20 * '+')
+                        [self.node.log(line, True, LogLevel.DEBUG) for line in str(self.whdrs_cache[h]).splitlines()]
+                        if broadcast_whdrs:
+                            self.node.broadcast(MsgType.WEAK_HEADER_MINED, self.whdrs_cache[h])
+                        whdrs_hash = self.whdrs_hash
+                        miner.set_job(prev_hash, ts, root, whdrs_hash, coinbase, strong_target)
+
+                self.node.request_missing_blocks() # parents of orphans, whose requests timed out
+
+                if time.time() - self.template_time >= Blockchain.TEMPLATE_REFRESH_INTERVAL:
+                    self.node.update_mempool()
+                    if mempool.version != mempool_version:
+                        self.node.log("Refreshing template of age {:.2f}s with {} txns".format(self.get_template_age(), len(mempool)), log_level=LogLevel.DEBUG)
+                        txns, tree = Blockchain.update_txns_tree(txns, tree, mempool.get_txns())
+                        mempool_version = mempool.version
+                        root = tree.get_root()
+                        miner.set_job(prev_hash, ts, root, whdrs_hash, coinbase, strong_target)
+                    self.template_time = time.time()
+
+                # weak headers are taken before a received block, so a compact block can be rebuilt from them
+                for rcv_whdr in self.take_rcv_whdrs(prev_hash):
+                    if rcv_whdr.target is None: # not sent with gossiped weak headers, it is given by their parent
+                        rcv_whdr.target = strong_target
+                    # self.node.log(20 * '-' + " Weak header received " + 20 * '-')
+                    [self.node.log(line, True, LogLevel.DEBUG) for line in str(rcv_whdr).splitlines()]
+
+                    if rcv_whdr.hash in self.whdrs_cache:
+                        self.node.log("... already existing weak header with H = {}.".format(rcv_whdr.hash), True)
+                        continue
+
+                    status = self.validate_weak_header(rcv_whdr, template_hdr)
+                    if BlkValStatus.WHDR_OK != status:
+                        self.node.log("... invalid weak header, error '{}'".format(status.name), True)
+                        continue
+
+                    self.add_whdr(rcv_whdr.hash, rcv_whdr)
+                    whdrs_hash = self.whdrs_hash
+                    miner.set_job(prev_hash, ts, root, whdrs_hash, coinbase, strong_target)
+
+                if not self.node.q_strong.empty():
+                    return None
+        finally:
+            miner.pause()
+            self.template_time = None
+
+
+    @staticmethod
+    def update_txns_tree(txns, tree, new_txns):
+        'Merkle tree of new_txns; if they only extend txns (e.g., new txns arrived to the mempool), the tree of txns is extended.'
+        if len(new_txns) >= len(txns) and all(a is b for a, b in zip(txns, new_txns)):
+            for tx in new_txns[len(txns):]:
+                tree.add(tx)
+            return new_txns, tree
+        return new_txns, MerkleTree(new_txns)
+
+
+    def take_rcv_whdrs(self, prev_hash):
+        """
+            Received weak headers mined on the block with prev_hash. Weak headers of a block that has not arrived yet
+            (e.g., it waits in q_strong or for missing items of its compact block) are kept until it arrives
+            (at most MAX_FUTURE_WHDRS, the newest ones); weak headers of other known blocks are dropped.
+        """
+        rcv_whdrs, self.future_whdrs = self.future_whdrs, []
+        while not self.node.q_weak.empty():
+            rcv_whdrs.append(self.node.q_weak.get())
 
-        while not stop_event.is_set():
-            time.sleep(0.0001)
+        whdrs = []
+        for wh in rcv_whdrs:
+            if wh.prev_hash == prev_hash:
+                whdrs.append(wh)
+            elif not wh.prev_hash in self.all_blocks:
+                self.future_whdrs.append(wh)
+        del self.future_whdrs[:-Blockchain.MAX_FUTURE_WHDRS]
+        return whdrs
 
-            nonce = str(random.randint(0, 10000000))
-            new_header = Header(prev_hash, ts, nonce, root, whdrs_hash, coinbase, strong_target)
-            h = new_header.hash
 
-            if int(h, 16) < new_header.target:
-                self.node.log(66 * '+')
-                self.node.log(20 * '+' + " Mined a new strong block " + 20 * '+')
-                self.node.log(66 * '+')
-                new_block =  Block(self.node, new_header, self.tip_block.length + 1,
-                    [Transaction.from_json_str(tx) for tx in txns], self.whdrs_cache.values()
-                )
-                new_block.print_block_info()
-                self.whdrs_cache = {}
-                return new_block
+    def get_template_age(self):
+        'Seconds since txns of the currently mined block were last synchronized with the mempool (None if not mining).'
+        return time.time() - self.template_time if self.template_time else None
 
-            if int(h, 16) < new_header.weak_target:
-                if not h in self.whdrs_cache:
-                    self.whdrs_cache[h] = new_header
-                    self.node.log(20 * '+' + " Mined a new weak header " + 20 * '+')
-                    [self.node.log(line, True, LogLevel.DEBUG) for line in str(self.whdrs_cache[h]).splitlines()]
-                    if broadcast_whdrs:
-                        self.node.broadcast(MsgType.WEAK_HEADER_MINED, self.whdrs_cache[h])
-                    whdrs_hash = self.compute_hash_of_set(self.whdrs_cache.values())
 
-            if not self.node.q_strong.empty():
-                return None
+    def add_whdr(self, whdr_hash, whdr):
+        self.whdrs_cache[whdr_hash] = whdr
+        self.whdrs_hash = Blockchain.extend_whdrs_hash(self.whdrs_hash, whdr_hash)
 
-            while not self.node.q_weak.empty():
-                rcv_whdr = self.node.q_weak.get()
-                # self.node.log(20 * '-' + " Weak header received " + 20 * '-')
-                [self.node.log(line, True, LogLevel.DEBUG) for line in str(rcv_whdr).splitlines()]
 
-                if rcv_whdr.hash in self.whdrs_cache:
-                    self.node.log("... already existing weak header with H = {}.".format(rcv_whdr.hash), True)
-                    continue
+    def clear_whdrs_cache(self):
+        self.whdrs_cache = {}
+        self.whdrs_hash = Blockchain.EMPTY_WHDRS_HASH
 
-                status = self.validate_weak_header(rcv_whdr, new_header)
-                if BlkValStatus.WHDR_OK != status:
-                    self.node.log("... invalid weak header, error '{}'".format(status.name), True)
-                    continue
 
-                self.whdrs_cache[rcv_whdr.hash] = rcv_whdr
-                whdrs_hash = self.compute_hash_of_set(self.whdrs_cache.values())
+    @staticmethod
+    def extend_whdrs_hash(whdrs_hash, whdr_hash):
+        'Running commitment to a list of weak headers, i.e., H(previous commitment || hash of appended header).'
+        return hashlib.sha256((whdrs_hash + whdr_hash).encode()).hexdigest()
 
 
-    def compute_hash_of_set(self, set_of_serializable):
-        if 0 == len(set_of_serializable):
-            return 64 * '0'
+    @staticmethod
+    def compute_whdrs_hash(whdrs):
+        whdrs_hash = Blockchain.EMPTY_WHDRS_HASH
+        for wh in whdrs:
+            whdrs_hash = Blockchain.extend_whdrs_hash(whdrs_hash, wh.hash)
 
-        s = '|'.join([ item.to_json_str() for item in set_of_serializable])
-        return hashlib.sha256(s.encode()).hexdigest()
+        return whdrs_hash
 
 
     def get_blocklen_of_mined_tx(self, tx):
+        entry = self.mainchain_txns.get(tx.hash)
+        return entry[1] if entry else None
+
+
+    def get_tx_proof(self, tx_hash):
+        'Merkle proof of a mainchain tx (None if it is not mined in mainchain).'
+        entry = self.mainchain_txns.get(tx_hash)
+        if not entry:
+            return None
+
+        block = self.all_blocks[entry[0]]
+        index = next(i for i, tx in enumerate(block.txns) if tx.hash == tx_hash)
+        return TxProof(tx_hash, block.header.hash, block.length, index, MerkleTree(block.txns).get_proof(index))
 
-        cur_block = self.tip_block
-        while cur_block.header.hash != self.GENESIS_PREV_HASH:
-            if tx.hash in (t.hash for t in cur_block.txns):
-                return cur_block.length
 
+    def find_mined_txns(self, tx_hashes, tip_hash):
+        """
+            Return those of tx_hashes that are already in the chain ending with tip_hash (None if tip is unknown).
+            Only blocks of this chain that are not in mainchain are scanned, the rest is looked up in the txns index.
+        """
+        if not tip_hash in self.all_blocks:
+            return None
+
+        side_txns = set()
+        cur_block = self.all_blocks[tip_hash]
+        while not self.is_in_mainchain(cur_block):
+            side_txns.update(tx.hash for tx in cur_block.txns)
             cur_block = self.all_blocks[cur_block.header.prev_hash]
 
-        return None
+        fork_len = cur_block.length
+        return [h for h in tx_hashes
+            if h in side_txns or (h in self.mainchain_txns and self.mainchain_txns[h][1] <= fork_len)
+        ]
+
+
+    def is_in_mainchain(self, block):
+        hashes = self.mainchain_hashes
+        return block.length <= len(hashes) and hashes[block.length - 1] == block.header.hash
 
 
     def get_chain(self, tip_hash):
@@ -301,16 +533,38 @@ class Blockchain:
         return chain[::-1]
 
 
-    def get_mainchain(self):
-        return self.get_chain(self.tip_block.header.hash)
+    def get_mainchain(self, from_length=GENESIS_LEN):
+        'Blocks of mainchain starting at the given length.'
+        return [self.all_blocks[h] for h in self.mainchain_hashes[from_length - 1:]]
+
+
+    def get_headers(self, from_length):
+        'Mainchain blocks starting at from_length without their txns, with at most MAX_HEADERS_PER_MSG strong and weak headers in total.'
+        blocks, n_hdrs = [], 0
+
+        hashes = self.mainchain_hashes
+        for length in range(max(from_length, Blockchain.GENESIS_LEN), len(hashes) + 1):
+            block = self.all_blocks[hashes[length - 1]]
+            n_hdrs += 1 + len(block.weak_hdrs)
+            if blocks and n_hdrs > Blockchain.MAX_HEADERS_PER_MSG:
+                break
+            blocks.append(Block(self.node, block.header, block.length, [], block.weak_hdrs))
+
+        return blocks
+
+
+    def get_blocks(self, from_length, count):
+        'At most count consecutive mainchain blocks starting at from_length.'
+        from_length = max(from_length, Blockchain.GENESIS_LEN)
+        return [self.all_blocks[h] for h in self.mainchain_hashes[from_length - 1 : from_length - 1 + max(count, 0)]]
 
 
     def get_block_by_length(self, length):
-        if length > self.tip_block.length or length < 1:
+        hashes = self.mainchain_hashes
+        if length > len(hashes) or length < 1:
             return None
 
-        chain = self.get_mainchain()
-        return chain[length - 1]
+        return self.all_blocks[hashes[length - 1]]
 
 
     def get_time_among_blocks(self):
@@ -331,7 +585,7 @@ class Blockchain:
         self.node.log("PoW of Chain: {}".format(self.chainPoW(self.tip_block)), True, log_level=LogLevel.DEBUG)
         self.node.log("Time among blocks: {:>2.2f} (+-{:>2.2f})".format(*self.get_time_among_blocks()), True, log_level=LogLevel.DEBUG)
 
-        for block in self.get_mainchain()[-last_n:]:
+        for block in self.get_mainchain(max(Blockchain.GENESIS_LEN, self.tip_block.length - last_n + 1)):
             b_str = block.to_short_str()
             self.node.log(b_str, True, log_level=LogLevel.DEBUG)
 
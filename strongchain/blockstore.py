@@ -0,0 +1,80 @@
+import os
+import json
+import struct
+
+from .block import Block
+from .wire import WireFormat
+from .lib.binary import BinaryFormatError, BinaryReader, BinaryWriter
+
+
+class BlockStore:
+    """
+        Append-only log of accepted blocks. Each record is the length of a block (4 bytes, big-endian)
+        followed by the block in binary wire format (prefixed by its version) or in compact JSON.
+        Blocks are appended by the mining thread and read back (in order) on restore.
+    """
+
+    RECORD_LEN = struct.Struct('>I')
+
+    def __init__(self, path, fresh=False):
+        self.path = path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'w+b' if fresh else 'a+b')
+
+
+    def append(self, block):
+        data = self.encode(block)
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(BlockStore.RECORD_LEN.pack(len(data)) + data)
+        self._file.flush()
+
+
+    def load(self, node):
+        'Read all stored blocks in the order they were appended. An incomplete record at the end (e.g., after a crash) is cut off.'
+        blocks = []
+
+        self._file.seek(0)
+        offset = 0
+        while True:
+            data = self._read_record()
+            if data is None:
+                break
+
+            blocks.append(self.decode(node, data))
+            offset = self._file.tell()
+
+        self._file.truncate(offset)
+
+        return blocks
+
+
+    def close(self):
+        self._file.close()
+
+
+    def _read_record(self):
+        prefix = self._file.read(BlockStore.RECORD_LEN.size)
+        if len(prefix) < BlockStore.RECORD_LEN.size:
+            return None
+
+        size, = BlockStore.RECORD_LEN.unpack(prefix)
+        data = self._file.read(size)
+        return data if len(data) == size else None
+
+
+    @staticmethod
+    def encode(block):
+        return BinaryWriter().varint(WireFormat.BINARY_V2).to_bytes() + block.to_bytes()
+
+
+    @staticmethod
+    def decode(node, data):
+        if data.startswith(b'{'): # written by older versions
+            return Block.from_json(node, json.loads(data))
+
+        r = BinaryReader(data)
+        version = r.varint()
+        if not version in WireFormat.SUPPORTED:
+            raise BinaryFormatError("unsupported version {} of stored block".format(version))
+        return Block.read_from(node, r, WireFormat.BINARY_V2 <= version)
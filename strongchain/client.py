@@ -62,6 +62,9 @@ class Client:
             elif cmd in ["address", "addr"]:
                 print("My address is: ", self.vk)
 
+            elif cmd in ["balance", "balances", "stats"] and self.node.LIGHT:
+                print("[Error]: Balances are not known to a light node.")
+
             elif cmd == "balance":
                 print("My balance is:", self.node.bm.balances[self.vk])
 
@@ -134,6 +137,15 @@ class Client:
             me_flag = "(me)" if vk == self.vk else ""
             print("{}: {} {}".format(vk[:32], cnt_weak[vk], me_flag))
 
+        template_age = self.node.blockchain.get_template_age()
+        print("\nMining template: {} pending txns, {}".format(len(self.node.mempool),
+            "age {:.2f}s".format(template_age) if template_age is not None else "not mining"
+        ))
+
+        print("\nSignature caches:")
+        print("verified signatures: {}".format(self.node.sig_verifier.cache))
+        print("verifying keys: {}".format(Transaction.VK_CACHE))
+
 
     def _cmd_txns(self):
         print("History of my transactions:")
@@ -177,7 +189,11 @@ class Client:
 
     def _cmd_transfer(self, cmd):
         tokens = [i.strip() for i in cmd[5:].split(",")]
-        if tokens[0] not in self.node.bm.balances:
+        if not Transaction.is_address(tokens[0]):
+            print("[Error]: Address must be a verifying key in hex.")
+            return False
+
+        if not self.node.LIGHT and tokens[0] not in self.node.bm.balances: # a light node leaves all checks to full nodes
             print("[Error]: Non existing address.")
             return False
 
@@ -188,7 +204,7 @@ class Client:
             print("[Error]: Amount must be a number.")
             return False
 
-        if amount > self.node.bm.balances[self.vk]:
+        if not self.node.LIGHT and amount > self.node.bm.balances[self.vk]:
             print("[Error]: Insufficient funds on my account.")
             return False
 
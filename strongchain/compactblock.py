@@ -0,0 +1,118 @@
+import json
+import hashlib
+
+from .block import Block
+from .header import Header
+from .lib.binary import BinaryReader, BinaryWriter
+
+
+class CompactBlock:
+    """
+        Strong block relayed as its header, length and short IDs of its weak headers and txns. Receivers have most
+        weak headers (gossiped while they are mined) and txns (in their mempools), so they rebuild the block from them
+        and ask the sender only for the missing ones (GET_BLOCK_TXNS). Short IDs are salted by the hash of the block,
+        so a collision in one block does not repeat in others.
+    """
+
+    __slots__ = ('header', 'length', 'whdr_ids', 'tx_ids', 'sender', 'whdrs', 'txns')
+
+    SHORT_ID_SIZE = 6
+
+    def __init__(self, header, length, whdr_ids, tx_ids):
+        self.header = header
+        self.length = length
+        self.whdr_ids = whdr_ids
+        self.tx_ids = tx_ids
+        self.sender = None # vk of the peer who sent it (not part of message)
+        self.whdrs = [None] * len(whdr_ids) # rebuilt weak headers (not part of message)
+        self.txns = [None] * len(tx_ids) # rebuilt txns (not part of message)
+
+
+    @classmethod
+    def from_block(cls, block):
+        block.complete_header()
+        short_id = CompactBlock.short_id_func(block.header.hash)
+        return cls(block.header, block.length, [short_id(wh.hash) for wh in block.weak_hdrs], [short_id(tx.hash) for tx in block.txns])
+
+
+    @staticmethod
+    def short_id_func(block_hash):
+        salt = bytes.fromhex(block_hash)
+        return lambda item_hash: hashlib.sha256(salt + bytes.fromhex(item_hash)).digest()[:CompactBlock.SHORT_ID_SIZE]
+
+
+    def fill(self, whdrs, txns):
+        'Fill in missing weak headers and txns from the given candidates (iterables of Header and Transaction objects).'
+        short_id = CompactBlock.short_id_func(self.header.hash)
+        for ids, items, candidates in [(self.whdr_ids, self.whdrs, whdrs), (self.tx_ids, self.txns, txns)]:
+            missing = {sid: i for i, sid in enumerate(ids) if items[i] is None}
+            for item in candidates:
+                if not missing:
+                    break
+                i = missing.pop(short_id(item.hash), None)
+                if i is not None:
+                    items[i] = item
+
+
+    def get_missing(self):
+        'Indices of missing weak headers and txns.'
+        return [i for i, wh in enumerate(self.whdrs) if wh is None], [i for i, tx in enumerate(self.txns) if tx is None]
+
+
+    def to_block(self, node):
+        'The rebuilt block (None if any of its weak headers or txns is missing).'
+        if any(item is None for item in self.whdrs + self.txns): # Transaction.__eq__ does not handle None
+            return None
+        return Block(node, self.header, self.length, list(self.txns), self.whdrs)
+
+
+    def to_json(self):
+        return {
+            "header" : self.header.to_json(),
+            "length" : self.length,
+            "whdr_ids" : [sid.hex() for sid in self.whdr_ids],
+            "tx_ids" : [sid.hex() for sid in self.tx_ids],
+        }
+
+
+    def to_json_str(self):
+        return json.dumps(self.to_json())
+
+
+    @classmethod
+    def from_json(cls, j):
+        return cls(Header.from_json(j.get("header")), j.get("length"),
+            [bytes.fromhex(sid) for sid in j.get("whdr_ids")], [bytes.fromhex(sid) for sid in j.get("tx_ids")]
+        )
+
+
+    @classmethod
+    def from_json_str(cls, json_string):
+        return CompactBlock.from_json(json.loads(json_string))
+
+
+    def write_to(self, w):
+        'Header, length and varint counts followed by short IDs of weak headers and txns.'
+        self.header.write_to(w).varint(self.length)
+        for ids in [self.whdr_ids, self.tx_ids]:
+            w.varint(len(ids))
+            for sid in ids:
+                w.raw(sid)
+        return w
+
+
+    def to_bytes(self):
+        return self.write_to(BinaryWriter()).to_bytes()
+
+
+    @classmethod
+    def read_from(cls, r):
+        header, length = Header.read_from(r), r.varint()
+        whdr_ids = [r.raw(CompactBlock.SHORT_ID_SIZE) for _ in range(r.varint())]
+        tx_ids = [r.raw(CompactBlock.SHORT_ID_SIZE) for _ in range(r.varint())]
+        return cls(header, length, whdr_ids, tx_ids)
+
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.read_from(BinaryReader(data))
@@ -0,0 +1,56 @@
+import time
+import random
+import itertools
+import collections
+
+
+class FragmentPool:
+    """
+        Messages that do not fit into a datagram (e.g., blocks with many txns) are sent as FRAGMENT messages, each
+        carrying (message id, index, count, chunk of the encoded message). Chunks are collected per sender and
+        message id until the message is complete. A message with more than MAX_FRAGMENTS chunks is not accepted;
+        at most MAX_MESSAGES incomplete messages are kept, each for at most TIMEOUT seconds (the oldest is dropped
+        first). A lost fragment loses the whole message, which is then requested again like any lost datagram.
+    """
+
+    MAX_FRAGMENTS = 256
+    MAX_MESSAGES = 8
+    TIMEOUT = 5
+
+    def __init__(self):
+        self.messages = collections.OrderedDict() # (sender, message id) => (time of the first chunk, [chunks])
+        self.ids = itertools.count(random.getrandbits(32)) # ids of our messages (not reused after a restart)
+
+
+    @staticmethod
+    def split(data, size):
+        return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+    def add(self, sender, fragment):
+        'Return the complete encoded message once all its chunks arrived (None until then, or if it is invalid).'
+        msg_id, index, count, chunk = fragment
+        if not 0 <= index < count <= FragmentPool.MAX_FRAGMENTS:
+            return None
+
+        now = time.time()
+        while self.messages and now - next(iter(self.messages.values()))[0] > FragmentPool.TIMEOUT:
+            self.messages.popitem(last=False)
+
+        key = (sender, msg_id)
+        _, chunks = self.messages.setdefault(key, (now, [None] * count))
+        if len(chunks) != count:
+            return None
+        chunks[index] = chunk
+
+        if any(c is None for c in chunks):
+            while len(self.messages) > FragmentPool.MAX_MESSAGES:
+                self.messages.popitem(last=False)
+            return None
+
+        del self.messages[key]
+        return b''.join(chunks)
+
+
+    def __len__(self):
+        return len(self.messages)
@@ -1,30 +1,70 @@
 
+import sys
 import json
+import struct
 import hashlib
 
+from .lib.binary import BinaryReader, BinaryWriter, is_hex
+
 class Header:
 
     MAX_TARGET         = 0x000FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
     INIT_STRONG_TARGET = 0x0000FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
     WEAK_TARGET_POWER  = 3      # on average, we should produce 2^3 weak headers per block
 
+    __slots__ = ('prev_hash', 'timestamp', 'nonce', 'root', 'coinbase', 'target', 'whdrs_hash', '_hash')
+
+    HASH_SIZE = 32
+    COINBASE_SIZE = 48
+    TIMESTAMP_LAYOUT = struct.Struct('>d')
+
+    MAX_SHARED_TARGETS = 64
+    _targets = {} # shared int objects of recent targets (all headers of a block and its neighbours use the same target)
+
     def __init__(self, prev_hash, timestamp, nonce, root, whdrs_hash, cb, target):
-        self.prev_hash = prev_hash
+        # fields repeated in many headers (weak headers of a block, blocks of a miner) are interned to be stored once
+        self.prev_hash = sys.intern(prev_hash) if prev_hash else prev_hash
         self.timestamp = float(timestamp)
         self.nonce = int(nonce)
         self.root = root
-        self.coinbase = cb # address of the miner who mined this block
-        self.target = target # strong target
+        self.coinbase = sys.intern(cb) if cb else cb # address of the miner who mined this block
+        self.target = Header._share_target(target) # strong target
 
         # NOT PART OF HEADER
         self.whdrs_hash = whdrs_hash # this field should not be part of header (here is just for simplicity)
 
 
+    @staticmethod
+    def _share_target(target):
+        'At most MAX_SHARED_TARGETS are kept (targets of invalid headers from peers must not accumulate); the oldest is dropped first.'
+        shared = Header._targets.setdefault(target, target)
+        if len(Header._targets) > Header.MAX_SHARED_TARGETS:
+            Header._targets.pop(next(iter(Header._targets)), None)
+        return shared
+
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != '_hash':
+            object.__setattr__(self, '_hash', None) # any change of a field invalidates the cached hash
+
     @property
     def hash(self):
+        if self._hash is None:
+            self._hash = self.compute_hash()
+        return self._hash
+
+    def compute_hash(self):
+        h = Header.midstate(self.prev_hash, self.timestamp, self.root, self.whdrs_hash, self.coinbase, self.target)
+        h.update(str(self.nonce).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def midstate(prev_hash, timestamp, root, whdrs_hash, cb, target):
+        'SHA-256 state after hashing all fields except nonce, which is the last part of the hashed string.'
         return hashlib.sha256(
-            (str(self.prev_hash) + str(self.timestamp) + str(self.nonce) + self.root + self.whdrs_hash + self.coinbase + str(self.target)).encode()
-        ).hexdigest()
+            (str(prev_hash) + str(float(timestamp)) + root + whdrs_hash + cb + str(target)).encode()
+        )
 
     @property
     def weak_target(self):
@@ -58,8 +98,50 @@ class Header:
 
     @classmethod
     def from_json(cls, j):
+        hashes = (j.get("prev_hash"), j.get("root"), j.get("whdrs_hash"))
+        if not all(is_hex(h, Header.HASH_SIZE) for h in hashes) or not is_hex(j.get("coinbase"), Header.COINBASE_SIZE):
+            raise ValueError("hash or coinbase of header is not in hex")
         return cls(j.get("prev_hash"), j.get("timestamp"), j.get("nonce"), j.get("root"), j.get("whdrs_hash"), j.get("coinbase"), j.get("target"))
 
 
+    def write_to(self, w):
+        'Fixed-size fields (prev_hash, timestamp, root, whdrs_hash, coinbase, target) followed by varint nonce.'
+        return self._write_common_to(w.hex(self.prev_hash, Header.HASH_SIZE)).raw(self.target.to_bytes(32, 'big')).varint(self.nonce)
+
+    def write_delta_to(self, w):
+        'Like write_to(), but without prev_hash and target, which weak headers share with their block.'
+        return self._write_common_to(w).varint(self.nonce)
+
+    def _write_common_to(self, w):
+        # a hex field of a wrong size (e.g., in a header from a peer) raises BinaryFormatError instead of being padded
+        return w.fixed(Header.TIMESTAMP_LAYOUT, self.timestamp).hex(self.root, Header.HASH_SIZE) \
+            .hex(self.whdrs_hash, Header.HASH_SIZE).hex(self.coinbase, Header.COINBASE_SIZE)
+
+    def to_bytes(self):
+        return self.write_to(BinaryWriter()).to_bytes()
+
+
+    @classmethod
+    def read_from(cls, r):
+        prev_hash = r.hex(Header.HASH_SIZE)
+        ts, root, whdrs_hash, cb = cls._read_common_from(r)
+        target = int.from_bytes(r.raw(32), 'big')
+        return cls(prev_hash, ts, r.varint(), root, whdrs_hash, cb, target)
+
+    @classmethod
+    def read_delta_from(cls, r, prev_hash, target):
+        ts, root, whdrs_hash, cb = cls._read_common_from(r)
+        return cls(prev_hash, ts, r.varint(), root, whdrs_hash, cb, target)
+
+    @staticmethod
+    def _read_common_from(r):
+        ts, = r.fixed(Header.TIMESTAMP_LAYOUT)
+        return ts, r.hex(Header.HASH_SIZE), r.hex(Header.HASH_SIZE), r.hex(Header.COINBASE_SIZE)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.read_from(BinaryReader(data))
+
+
     def __str__(self):
         return self.to_json_str()
@@ -0,0 +1,31 @@
+from .block import Block
+from .blockchain import Blockchain
+
+
+class HeaderChain(Blockchain):
+    """
+        Blocks without txns, i.e., strong headers with their weak headers: the chain of a light node, and chains
+        of peers when a full node syncs headers first. Roots of txns cannot be checked, so inclusion of txns is
+        proven by Merkle proofs (TxProof) from full nodes instead.
+    """
+
+    def __init__(self, node, blockchain=None):
+        'The mainchain of blockchain (if any) is copied without txns.'
+        Blockchain.__init__(self, node)
+        self.proven_txns = {} # tx hash => TxProof
+
+        if blockchain:
+            for block in blockchain.get_mainchain(Blockchain.GENESIS_LEN + 1):
+                self._index_block(Block(node, block.header, block.length, [], block.weak_hdrs))
+            self.tip_block = self.best_tip
+
+
+    def check_txns_integrity(self, block):
+        return True
+
+
+    def get_blocklen_of_mined_tx(self, tx):
+        proof = self.proven_txns.get(tx.hash)
+        if proof and proof.block_hash in self.all_blocks and self.is_in_mainchain(self.all_blocks[proof.block_hash]):
+            return proof.length
+        return None
@@ -0,0 +1,133 @@
+import numpy as np
+
+
+class AccountRegistry:
+    'Dense integer IDs of account addresses (verifying keys), shared by all ledgers of a node.'
+
+    def __init__(self):
+        self.ids = {} # address => ID
+        self.addresses = [] # ID => address
+
+
+    def get_id(self, address):
+        account_id = self.ids.get(address)
+        if account_id is None:
+            account_id = self.ids[address] = len(self.addresses)
+            self.addresses.append(address)
+        return account_id
+
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+class Ledger:
+    """
+        Balances of accounts in a NumPy array indexed by account IDs, in fixed-point units (UNIT per token).
+        For callers, it behaves like a dict address => balance in tokens.
+    """
+
+    UNIT = 10 ** 8
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._balances = np.zeros(max(16, len(registry)), dtype=np.int64)
+        self._addresses = set() # accounts of this ledger (those ever set or changed)
+
+
+    @staticmethod
+    def to_units(amount):
+        return int(round(amount * Ledger.UNIT))
+
+    @staticmethod
+    def from_units(units):
+        return units / Ledger.UNIT
+
+
+    def units_of(self, address):
+        account_id = self.registry.ids.get(address)
+        if account_id is None or account_id >= len(self._balances):
+            return 0
+        return int(self._balances[account_id])
+
+
+    def apply(self, ids, amounts, sign=1):
+        'Add a batch of changes (vectors of distinct account IDs and amounts in units) to balances.'
+        self._reserve(len(self.registry))
+        self._balances[ids] += sign * amounts
+        self._addresses.update(self.registry.addresses[i] for i in ids)
+
+
+    def export(self):
+        'Addresses of this ledger (ordered by ID) and a copy of their balances in units.'
+        addresses = list(self)
+        ids = np.fromiter((self.registry.ids[addr] for addr in addresses), dtype=np.int64, count=len(addresses))
+        self._reserve(len(self.registry))
+        return addresses, self._balances[ids].copy()
+
+
+    def restore(self, addresses, units):
+        'Replace all balances by the exported ones.'
+        ids = np.fromiter((self.registry.get_id(addr) for addr in addresses), dtype=np.int64, count=len(addresses))
+        self._balances = np.zeros(max(16, len(self.registry)), dtype=np.int64)
+        self._balances[ids] = units
+        self._addresses.update(addresses)
+
+
+    def _reserve(self, size):
+        if size > len(self._balances):
+            grown = np.zeros(max(size, 2 * len(self._balances)), dtype=np.int64)
+            grown[:len(self._balances)] = self._balances
+            self._balances = grown
+
+
+    def __getitem__(self, address):
+        if not address in self._addresses:
+            raise KeyError(address)
+        return Ledger.from_units(self.units_of(address))
+
+    def __setitem__(self, address, amount):
+        account_id = self.registry.get_id(address)
+        self._reserve(account_id + 1)
+        self._balances[account_id] = Ledger.to_units(amount)
+        self._addresses.add(address)
+
+    def __contains__(self, address):
+        return address in self._addresses
+
+    def __iter__(self):
+        return iter(sorted(self._addresses, key=self.registry.ids.get))
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def get(self, address, default=None):
+        return self[address] if address in self._addresses else default
+
+    def items(self):
+        return [(addr, self[addr]) for addr in self]
+
+
+class LedgerOverlay:
+    'Copy-on-write scratch view of a ledger: changes (in units) are kept aside and the ledger itself stays untouched.'
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.changes = {} # address => balance in units
+
+
+    def units_of(self, address):
+        if address in self.changes:
+            return self.changes[address]
+        return self.ledger.units_of(address)
+
+
+    def add(self, address, units):
+        self.changes[address] = self.units_of(address) + units
+
+
+    def apply(self, ids, amounts, sign=1):
+        'The same as Ledger.apply(), but kept aside.'
+        addresses = self.ledger.registry.addresses
+        for account_id, amount in zip(ids, amounts):
+            self.add(addresses[account_id], sign * int(amount))
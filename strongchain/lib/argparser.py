@@ -1,8 +1,13 @@
 
+import os
 import argparse
 
 ArgParser = argparse.ArgumentParser(add_help = True, description = "Management Tool of StrongChain")
 
 group = ArgParser.add_argument_group(title = "Node Options")
 group.add_argument('--verbose', action = "store_true", default = False, help = "Display verbose messages in node's log.")
-group.add_argument('--selfish', action = "store_true", default = False, help = "Act as a selfish miner.")
\ No newline at end of file
+group.add_argument('--selfish', action = "store_true", default = False, help = "Act as a selfish miner.")
+group.add_argument('--light', action = "store_true", default = False, help = "Run a light (SPV) node that keeps only headers and does not mine.")
+group.add_argument('--workers', type = int, default = os.cpu_count(), help = "Number of mining processes and of processes verifying signatures (default: number of CPU cores).")
+group.add_argument('--fresh', action = "store_true", default = False, help = "Discard blocks stored by previous runs of this node.")
+group.add_argument('--mempool-size', type = int, default = 10000, help = "Maximal number of pending transactions (default: 10000).")
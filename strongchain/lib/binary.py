@@ -0,0 +1,106 @@
+import struct
+
+
+class BinaryFormatError(Exception):
+    'Malformed or truncated binary data.'
+    pass
+
+
+def is_hex(value, size):
+    'Whether a value (e.g., a field received from a peer) is a hex string of size bytes.'
+    if not isinstance(value, str) or len(value) != 2 * size:
+        return False
+    try:
+        return len(bytes.fromhex(value)) == size # fromhex() skips whitespace, so it yields fewer bytes
+    except ValueError:
+        return False
+
+
+class BinaryWriter:
+    'Builds binary data: fixed-size fields, varints and length-prefixed byte strings.'
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def raw(self, data):
+        self.buf += data
+        return self
+
+    def fixed(self, layout, *values):
+        'Values packed by a struct.Struct.'
+        self.buf += layout.pack(*values)
+        return self
+
+    def hex(self, hex_str, size):
+        'Hex string (e.g., hash or key) stored as size raw bytes.'
+        data = bytes.fromhex(hex_str)
+        if len(data) != size:
+            raise BinaryFormatError("expected {} bytes, got {}".format(size, len(data)))
+        return self.raw(data)
+
+    def varint(self, value):
+        'Unsigned LEB128.'
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            if value:
+                self.buf.append(byte | 0x80)
+            else:
+                self.buf.append(byte)
+                return self
+
+    def bytes(self, data):
+        return self.varint(len(data)).raw(data)
+
+    def str(self, value):
+        return self.bytes(value.encode('utf-8'))
+
+    def to_bytes(self):
+        return bytes(self.buf)
+
+
+class BinaryReader:
+    'Reads data produced by BinaryWriter.'
+
+    def __init__(self, data, offset=0):
+        self.data = bytes(data)
+        self.offset = offset
+
+    def raw(self, size):
+        if self.offset + size > len(self.data):
+            raise BinaryFormatError("unexpected end of data")
+        chunk = self.data[self.offset : self.offset + size]
+        self.offset += size
+        return chunk
+
+    def fixed(self, layout):
+        try:
+            values = layout.unpack_from(self.data, self.offset)
+        except struct.error:
+            raise BinaryFormatError("unexpected end of data")
+        self.offset += layout.size
+        return values
+
+    def hex(self, size):
+        return self.raw(size).hex()
+
+    def varint(self):
+        value = shift = 0
+        while True:
+            if self.offset >= len(self.data):
+                raise BinaryFormatError("unexpected end of data")
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def bytes(self):
+        return self.raw(self.varint())
+
+    def str(self):
+        return self.bytes().decode('utf-8')
+
+    def at_end(self):
+        return self.offset == len(self.data)
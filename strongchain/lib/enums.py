@@ -9,6 +9,17 @@ class MsgType:
     TRANSACTION  = 5
     GET_BLOCK    = 6
     BLOCK        = 7
+    GET_HEADERS  = 8
+    HEADERS      = 9
+    GET_PROOF    = 10
+    PROOF        = 11
+    GET_BLOCK_BY_HASH = 12
+    GET_BLOCKS   = 13
+    BLOCKS       = 14
+    COMPACT_BLOCK  = 15
+    GET_BLOCK_TXNS = 16
+    BLOCK_TXNS     = 17
+    FRAGMENT       = 18
 
 class LogLevel:
     ERROR = 1
@@ -0,0 +1,37 @@
+import threading
+import collections
+
+
+class LRUCache:
+    'Thread-safe mapping with at most capacity items, evicting the least recently used ones. Counts hits and misses of get().'
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return self._items[key]
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def __str__(self):
+        return "{} hits, {} misses, {}/{} items".format(self.hits, self.misses, len(self), self.capacity)
@@ -2,10 +2,12 @@ import json
 
 
 class NodeConf:
-    def __init__(self, port, address, vk):
+    def __init__(self, port, address, vk, wire=None, light=False):
         self.port = port
         self.address = address
         self.vk = vk
+        self.wire = wire # versions of binary wire format supported by the node (None means JSON only)
+        self.light = light # light node keeps only headers, so it neither serves blocks nor receives broadcasts
 
 
     def __eq__(self, other):
@@ -17,14 +19,16 @@ class NodeConf:
     @classmethod
     def from_json_str(cls, json_string):
         j = json.loads(json_string)
-        return cls(j.get("port"), j.get("address"), j.get("vk"))
+        return cls(j.get("port"), j.get("address"), j.get("vk"), j.get("wire"), j.get("light", False))
 
 
     def to_json(self):
         return {
             "port" : self.port,
             "address" : self.address,
-            "vk" : self.vk
+            "vk" : self.vk,
+            "wire" : self.wire,
+            "light" : self.light
         }
 
 
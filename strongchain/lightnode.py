@@ -0,0 +1,187 @@
+import time
+import threading
+
+from .node import Node
+from .blockchain import Blockchain
+from .headerchain import HeaderChain
+from .fragmentpool import FragmentPool
+from .lib.queue import Queue
+from .lib.enums import LogLevel, MsgType, BlockValidationStatus as BlkValStatus
+from .lib.nodeconfig import NodeConf
+from .wire import WireFormat
+
+
+class LightNode(Node):
+    """
+        SPV node: it downloads and validates only the header chain (strong headers with weak headers), sends txns
+        of its client to full nodes and asks them for Merkle proofs of these txns. It does not mine, it keeps
+        neither txns of blocks nor balances, and full nodes do not broadcast blocks, weak headers, or txns to it.
+    """
+
+    LIGHT = True
+
+    SYNC_INTERVAL = 1 # how often to ask for new headers (while the last request brought none)
+    PROOF_INTERVAL = 2 # how often to ask for proofs of txns that are not proven yet
+
+    def __init__(self, node_id, conf, priv_key, peers = None, log_level=LogLevel.INFO):
+
+        self.id = node_id
+        self.log_level = log_level
+        self.log_file = self._init_log_file()
+
+        self.pub_key = conf.vk
+        self.priv_key = priv_key
+        self.address = conf.address
+        self.port = conf.port
+        self.blockchain = HeaderChain(self) # node's chain of headers
+        self.bm = None # balances are not known without txns
+        self.peers = peers
+        self.full_peers = [] # online full nodes that serve headers and proofs
+        self.pending_txns = {} # tx hash => tx sent by our client and not proven yet
+        self.fork_depth = 0 # how far below our tip we ask for headers, when a peer is on another chain
+        self.fragments = FragmentPool() # chunks of received messages larger than a datagram
+
+        # thread-safe queues for client VS SPV thread
+        self.q_client_txns_mined = Queue()
+        self.q_txns_from_client = Queue()
+        # thread-safe queues for listening VS SPV thread
+        self.q_headers = Queue()
+        self.q_proofs = Queue()
+
+        # events
+        self.stop_mining_event = threading.Event()
+        self.stop_listening_event = threading.Event()
+        self.blockchain_downloaded_event = threading.Event()
+
+
+    def get_conf(self):
+        return NodeConf(self.port, self.address, self.pub_key, WireFormat.SUPPORTED, light=True)
+
+
+    def mining_thread(self):
+        'Light node does not mine: this thread follows the header chain, sends txns of our client, and checks their proofs.'
+        self.log('SPV thread started')
+        self._wait_on_download_of_blockchain()
+
+        last_sync = last_proofs = 0
+        i = 0
+        while not self.stop_mining_event.is_set():
+
+            while not self.q_txns_from_client.empty():
+                tx = self.q_txns_from_client.get()
+                self.pending_txns[tx.hash] = tx
+                self.broadcast(MsgType.TRANSACTION, tx)
+
+            new_headers = 0
+            while not self.q_headers.empty():
+                new_headers += self._add_headers(self.q_headers.get())
+
+            while not self.q_proofs.empty():
+                self._check_proof(self.q_proofs.get())
+
+            if self.full_peers:
+                if new_headers or self.fork_depth or time.time() - last_sync >= LightNode.SYNC_INTERVAL:
+                    i += 1
+                    self._request_headers(self.full_peers[i % len(self.full_peers)])
+                    last_sync = time.time()
+
+                if self.pending_txns and time.time() - last_proofs >= LightNode.PROOF_INTERVAL:
+                    for tx_hash in self.pending_txns:
+                        i += 1
+                        self.send_message({'type': MsgType.GET_PROOF, 'from': self.pub_key, 'data': tx_hash}, self.full_peers[i % len(self.full_peers)])
+                    last_proofs = time.time()
+
+            time.sleep(0.1)
+
+
+    def download_blockchain(self, sock):
+        self.full_peers = self._handshake_peers(sock)
+
+        if 0 == len(self.full_peers):
+            self.log("[Listening thread]: No full nodes are online.")
+            return
+
+        sock.settimeout(Node.SYNC_POLL_INTERVAL)
+        self.log("[Listening thread]: full nodes {} are online.".format(str([p.vk[:16] for p in self.full_peers])))
+        self._sync_headers(sock, self.full_peers, self.blockchain)
+        self.log("[SPV]: synced headers, length of chain is {}".format(self.blockchain.tip_block.length))
+        sock.settimeout(1)
+
+
+    def _request_headers(self, peer):
+        from_length = max(Blockchain.GENESIS_LEN + 1, self.blockchain.tip_block.length + 1 - self.fork_depth)
+        self.send_message({'type': MsgType.GET_HEADERS, 'from': self.pub_key, 'data': from_length}, peer)
+
+
+    def _add_headers(self, blocks):
+        'Validate and add blocks without txns, switching to the strongest chain. Returns the number of added blocks.'
+        added = 0
+
+        for block in blocks or []:
+            status = self.blockchain.validate_block(block)
+            if BlkValStatus.EXISTING_BLOCK == status:
+                continue
+
+            if BlkValStatus.NON_EXISTING_PRED == status and 0 == added:
+                # the peer's chain forked below our tip, so ask for its headers from a lower length
+                self.fork_depth = min(max(1, 2 * self.fork_depth), self.blockchain.tip_block.length)
+                self.log("[SPV]: unknown parent of block[{}], asking for headers {} blocks below our tip".format(block.length, self.fork_depth), True)
+                return added
+
+            if BlkValStatus.OK != status:
+                self.log("[!!!] Validation of header of block[{}] failed with '{}' [!!!]".format(block.length, status.name))
+                break
+
+            self.blockchain.add_block(block)
+            if self.blockchain.chainPoW(block) > self.blockchain.chainPoW(self.blockchain.tip_block):
+                self.blockchain.tip_block = block
+            added += 1
+
+        self.fork_depth = 0 # we know the parent of the peer's headers
+        if added:
+            self.log("[SPV]: added {} headers, length of chain is {}".format(added, self.blockchain.tip_block.length))
+        return added
+
+
+    def _check_proof(self, proof):
+        tx = self.pending_txns.get(proof.tx_hash)
+        if tx is None:
+            return
+
+        block = self.blockchain.all_blocks.get(proof.block_hash)
+        if block is None or not self.blockchain.is_in_mainchain(block):
+            return # we do not have the header yet (or it is not in our mainchain), so ask again later
+
+        if not proof.verify(tx, block.header):
+            self.log("[!!!] Invalid proof of Tx {} in block[{}] [!!!]".format(tx.hash, proof.length))
+            return
+
+        self.log("[SPV]: Tx {} is proven to be in block[{}]".format(tx.hash, proof.length))
+        self.blockchain.proven_txns[tx.hash] = proof
+        del self.pending_txns[tx.hash]
+        self.q_client_txns_mined.put(tx)
+
+
+    def _handle_message(self, msg):
+        if MsgType.HEADERS == msg['type']:
+            self.q_headers.put(msg['data'])
+
+        elif MsgType.PROOF == msg['type']:
+            if msg['data'] is not None:
+                self.q_proofs.put(msg['data'])
+
+        elif MsgType.NEW_PEER == msg['type']:
+            peer = self._add_new_peer(msg["data"])
+            if not peer:
+                return # error occured
+
+            self.send_message({'type': MsgType.NEW_PEER_ACK, 'from': self.pub_key, 'data': self.get_conf()}, peer)
+            if not peer.light and not peer in self.full_peers:
+                self.full_peers.append(peer)
+
+        else:
+            self.log("[Listening thread]: Ignoring message of type {} from {}".format(msg['type'], msg['from'][:16]), log_level=LogLevel.DEBUG)
+
+
+    def shutdown(self):
+        pass
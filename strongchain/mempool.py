@@ -0,0 +1,128 @@
+import collections
+
+from .ledger import Ledger
+from .lib.enums import LogLevel
+
+
+class Mempool:
+    """
+        Pending txns to mine, keyed by tx hash and kept in the order of arrival. A pending tx is valid if its
+        signature is valid, it is not mined in mainchain yet, and the confirmed balance of its sender covers
+        all pending txns of the sender up to this one (in Ledger units).
+
+        Validation is incremental: revalidate() checks only senders with new txns and accounts touched
+        by blocks applied or reverted since the last call. At most max_size txns are kept; when full,
+        the newest tx of the sender with the most pending txns is evicted.
+    """
+
+    MAX_SIZE = 10000
+
+    def __init__(self, node, max_size=None):
+        self.node = node
+        self.max_size = max_size or Mempool.MAX_SIZE
+        self.txns = collections.OrderedDict() # tx hash => Transaction
+        self.by_sender = {} # sender => {tx hash => Transaction} (in the order of arrival)
+        self.pending_spends = {} # sender => total amount of its pending txns (in units)
+        self.tip_hash = node.bm.tip_hash # tip of chain, for which the txns were validated last time
+        self.version = 0 # incremented on each change of txns
+        self._dirty = set() # senders to revalidate
+
+
+    def add(self, tx):
+        'Return False if tx is already pending, its sender or receiver is not an address, or it is evicted right away.'
+        if tx.hash in self.txns or not tx.has_valid_addresses():
+            return False
+
+        self.txns[tx.hash] = tx
+        self.by_sender.setdefault(tx.sender, {})[tx.hash] = tx
+        self.pending_spends[tx.sender] = self.pending_spends.get(tx.sender, 0) + Ledger.to_units(tx.amount)
+        self._dirty.add(tx.sender)
+        self.version += 1
+
+        while len(self.txns) > self.max_size:
+            self._evict()
+        return tx.hash in self.txns
+
+
+    def remove(self, tx_hash):
+        tx = self.txns.pop(tx_hash, None)
+        if tx is None:
+            return None
+
+        self.version += 1
+        senders_txns = self.by_sender[tx.sender]
+        del senders_txns[tx_hash]
+        if senders_txns:
+            self.pending_spends[tx.sender] -= Ledger.to_units(tx.amount)
+        else:
+            del self.by_sender[tx.sender]
+            del self.pending_spends[tx.sender]
+        return tx
+
+
+    def _evict(self):
+        sender = max(self.by_sender, key=lambda s: len(self.by_sender[s]))
+        tx = self.remove(next(reversed(self.by_sender[sender])))
+        self.node.log("Mempool is full, evicted Tx {}".format(tx.hash), True, LogLevel.DEBUG)
+
+
+    def revalidate(self):
+        'Drop invalid txns of affected senders and return their number.'
+        self._mark_changed_accounts()
+        if not self._dirty:
+            return 0
+
+        senders = self._dirty & self.by_sender.keys()
+        self._dirty = set()
+        n_txns = len(self.txns)
+
+        # signatures (cached for already pending txns), amounts and duplicates in mainchain
+        txns = [tx for s in senders for tx in self.by_sender[s].values()]
+        mainchain_txns = self.node.blockchain.mainchain_txns
+        for tx, valid_sig in zip(txns, self.node.sig_verifier.verify(txns)):
+            if not valid_sig or tx.amount < 0 or tx.hash in mainchain_txns:
+                self.remove(tx.hash)
+
+        # pending spends covered by balances
+        balances = self.node.bm.balances
+        for sender in senders & self.by_sender.keys():
+            balance, spent = balances.units_of(sender), 0
+            if self.pending_spends[sender] <= balance:
+                continue # all pending txns of the sender are covered
+
+            for tx in list(self.by_sender[sender].values()):
+                amount = Ledger.to_units(tx.amount)
+                if spent + amount > balance:
+                    self.remove(tx.hash)
+                else:
+                    spent += amount
+
+        return n_txns - len(self.txns)
+
+
+    def _mark_changed_accounts(self):
+        'Mark accounts touched by blocks applied to (or reverted from) balances since the last validation.'
+        blockchain = self.node.blockchain
+        tip_hash = self.node.bm.tip_hash
+        if tip_hash == self.tip_hash:
+            return
+
+        to_revert, to_apply = blockchain.get_fork_path(blockchain.all_blocks[self.tip_hash], blockchain.all_blocks[tip_hash])
+        for block in to_revert + to_apply:
+            self._dirty.update(tx.sender for tx in block.txns)
+            self._dirty.update(tx.receiver for tx in block.txns)
+            self._dirty.add(block.header.coinbase)
+            self._dirty.update(wh.coinbase for wh in block.weak_hdrs)
+        self.tip_hash = tip_hash
+
+
+    def get_txns(self):
+        return list(self.txns.values())
+
+
+    def __len__(self):
+        return len(self.txns)
+
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self.txns
@@ -1,106 +1,111 @@
 import hashlib
+import binascii
 
 
 class MerkleTree:
-    def __init__(self, leaves_list):
-        self.nodes = []
-        self.tree = []
-        self.proof_path = []
-        for leave in leaves_list:
-            self.nodes.append(single_hash(leave))
-        self.tree.append(self.nodes)
-        self.build(self.nodes)
-        self.root = self.get_root()
+    """
+        Binary Merkle tree over raw 32-byte digests. All levels are cached (levels[0] are hashes of leaves,
+        levels[-1] holds the root), so a leaf is appended in O(log n) and proofs are served in O(log n).
+        The last node of a level with odd length is promoted to the next level as it is.
+
+        In compat mode (default), roots and proofs are the same as in older versions: an inner node is
+        the hash of the hex strings of its children. Otherwise, it is the hash of the concatenated digests.
+    """
+
+    EMPTY_ROOT = '0' * 64
+
+    def __init__(self, leaves_list, compat=True):
+        self.compat = compat
+        self.levels = [[leaf_hash(leaf) for leaf in leaves_list]]
+        self.build(self.levels[0])
 
     @classmethod
-    def compute_root(cls, leaves):
-        tree = cls(leaves)
+    def compute_root(cls, leaves, compat=True):
+        tree = cls(leaves, compat)
         return tree.root
 
-    def add(self, new_leave):
-        # Add entries to tree
-        self.nodes.append(single_hash(new_leave))
-        self.tree = []
-        self.tree.append(self.nodes)
-        self.build(self.nodes)
-        self.root = self.get_root()
+    @property
+    def root(self):
+        return self.get_root()
 
-    def build(self, start_list):
-        # Build tree computing new root
-        if 0 == len(start_list):
-            return '0' * 64
-
-        end_list = []
-        if len(start_list) > 1:
-            if len(start_list) % 2 == 0:
-                for i in range(0, len(start_list), 2):
-                    end_list.append(double_hash(start_list[i], start_list[i + 1]))
+    def add(self, new_leave):
+        'Append a leaf and update the last node of each level.'
+        levels = self.levels
+        levels[0].append(leaf_hash(new_leave))
+
+        i = 0
+        while len(levels[i]) > 1:
+            level = levels[i]
+            last = len(level) - 1
+            parent = level[last] if last % 2 == 0 else node_hash(level[last - 1], level[last], self.compat)
+
+            if i + 1 == len(levels):
+                levels.append([])
+            upper = levels[i + 1]
+            if last // 2 < len(upper):
+                upper[last // 2] = parent
             else:
-                for i in range(0, len(start_list) - 1, 2):
-                    end_list.append(double_hash(start_list[i], start_list[i + 1]))
-                end_list.append(start_list[-1])
-            self.tree.append(end_list)
-            return self.build(end_list)
+                upper.append(parent)
+            i += 1
 
-        else:
-            if len(self.tree) == 0:
-                end_list.append(start_list[0])
-                self.tree.append(end_list)
-                return start_list[0]
+    def build(self, start_list):
+        'Compute all levels above the leaves, level by level.'
+        self.levels = [start_list]
+        level = start_list
+        while len(level) > 1:
+            upper = [node_hash(level[i], level[i + 1], self.compat) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                upper.append(level[-1])
+            self.levels.append(upper)
+            level = upper
 
     def get_proof(self, entry):
-        self.proof_path = []
-        if int(entry) > len(self.nodes) - 1:
+        'Sibling hashes (hex) on the path from the entry-th leaf to the root, each with its side (l or r).'
+        entry = int(entry)
+        if entry < 0 or entry >= len(self.levels[0]):
             return []
 
-        else:
-            next_entry = entry
-            for i in range(0, len(self.tree) - 1):
-                if len(self.tree[i]) != 1:
-                    if int(next_entry) % 2 == 0:
-                        if int(next_entry) != len(self.tree[i]) - 1:
-                            self.proof_path.append([self.tree[i][int(next_entry) + 1], 'r'])
-                    else:
-                        self.proof_path.append([self.tree[i][int(next_entry) - 1], 'l'])
-                next_entry = get_next_entry(next_entry)
-            return self.proof_path
+        proof_path = []
+        for level in self.levels[:-1]:
+            if entry % 2 == 0:
+                if entry + 1 < len(level): # otherwise, the node is promoted
+                    proof_path.append([level[entry + 1].hex(), 'r'])
+            else:
+                proof_path.append([level[entry - 1].hex(), 'l'])
+            entry //= 2
+        return proof_path
 
     def get_root(self):
 
         # Return the current root
-        if 0 == len(self.tree[-1]):
-            return '0' * 64
+        if 0 == len(self.levels[0]):
+            return MerkleTree.EMPTY_ROOT
+
+        return self.levels[-1][0].hex()
 
-        return str(self.tree[-1][0])
+    def __len__(self):
+        return len(self.levels[0])
 
 
-def single_hash(value):
+def leaf_hash(value):
 
     if not isinstance(value, str):
         value = str(value)
 
-    return hashlib.sha256(value.encode()).hexdigest()
+    return hashlib.sha256(value.encode()).digest()
 
 
-def double_hash(node1, node2):
-    return hashlib.sha256((node1 + node2).encode()).hexdigest()
-
-
-def get_next_entry(value):
-    if value <= 1:
-        return 0
-    else:
-        if value % 2 == 0:
-            return int(value / 2)
-        else:
-            return int((value - 1) / 2)
+def node_hash(left, right, compat=True):
+    if compat:
+        return hashlib.sha256(binascii.hexlify(left + right)).digest() # hex of both children
+    return hashlib.sha256(left + right).digest()
 
 
-def verify_proof(entry, proof, root):
-    test_val = single_hash(entry)
-    for i in range(0, len(proof)):
-        if proof[i][1] == 'l':
-            test_val = double_hash(proof[i][0], test_val)
+def verify_proof(entry, proof, root, compat=True):
+    test_val = leaf_hash(entry)
+    for sibling, side in proof:
+        if side == 'l':
+            test_val = node_hash(bytes.fromhex(sibling), test_val, compat)
         else:
-            test_val = double_hash(test_val, proof[i][0])
-    return test_val == root
+            test_val = node_hash(test_val, bytes.fromhex(sibling), compat)
+    return test_val.hex() == root
@@ -0,0 +1,106 @@
+import os
+import queue
+import multiprocessing
+
+from .header import Header
+
+
+class Miner:
+    """
+        Pool of mining processes. Each worker scans its own slice of the nonce space
+        (nonces worker_idx, worker_idx + N, worker_idx + 2N, ...) of the current job
+        and reports every header that meets the weak target back to the node.
+    """
+
+    HASHES_PER_POLL = 2048 # how many nonces a worker tries before checking for a new job
+
+    _STOP = 'STOP'
+
+    def __init__(self, n_workers=None):
+        self.n_workers = max(1, n_workers or os.cpu_count() or 1)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._jobs = [self._ctx.Queue() for _ in range(self.n_workers)]
+        self._procs = []
+        self._job_id = 0
+
+
+    def start(self):
+        if self._procs:
+            return
+
+        for i in range(self.n_workers):
+            p = self._ctx.Process(target=_worker_loop, args=(i, self.n_workers, self._jobs[i], self._results),
+                name='Miner-{}'.format(i), daemon=True
+            )
+            p.start()
+            self._procs.append(p)
+
+
+    def set_job(self, prev_hash, timestamp, root, whdrs_hash, coinbase, target):
+        'Replace the current job of all workers; results of older jobs are dropped.'
+        self._job_id += 1
+        job = (self._job_id, prev_hash, timestamp, root, whdrs_hash, coinbase, target)
+        for q in self._jobs:
+            q.put(job)
+
+
+    def pause(self):
+        self._job_id += 1
+        for q in self._jobs:
+            q.put(None)
+
+
+    def get_result(self, timeout):
+        'Return (nonce, hash) of a weak or strong header found for the current job, or None on timeout.'
+        try:
+            while True:
+                job_id, nonce, h = self._results.get(timeout=timeout)
+                if job_id == self._job_id:
+                    return nonce, h
+        except queue.Empty:
+            return None
+
+
+    def shutdown(self):
+        for q in self._jobs:
+            q.put(Miner._STOP)
+        for p in self._procs:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+
+
+def _worker_loop(worker_idx, n_workers, jobs, results):
+    job = mined_job = None
+    nonce = worker_idx
+
+    while True:
+        try:
+            # block while idle, otherwise only check whether a newer job arrived
+            item = jobs.get() if job is None else jobs.get_nowait()
+            while True:
+                if Miner._STOP == item:
+                    return
+                job, nonce = item, worker_idx
+                item = jobs.get_nowait()
+        except queue.Empty:
+            pass
+
+        if job is None:
+            continue
+
+        if job is not mined_job:
+            mined_job = job
+            job_id, prev_hash, timestamp, root, whdrs_hash, coinbase, target = job
+            midstate = Header.midstate(prev_hash, timestamp, root, whdrs_hash, coinbase, target)
+            weak_target = target << Header.WEAK_TARGET_POWER
+
+        for _ in range(Miner.HASHES_PER_POLL):
+            h = midstate.copy()
+            h.update(b'%d' % nonce)
+            digest = h.digest()
+            if int.from_bytes(digest, 'big') < weak_target:
+                results.put((job_id, nonce, digest.hex()))
+            nonce += n_workers
@@ -1,25 +1,44 @@
 import os
-import json
-import copy
 import time
 import socket
 import threading
 
 from .block import Block
-from .header import Header
+from .miner import Miner
+from .sigverifier import SigVerifier
 from .blockchain import Blockchain, MsgType
-from .transaction import Transaction
+from .headerchain import HeaderChain
+from .blockstore import BlockStore
+from .snapshots import Snapshots
+from .mempool import Mempool
+from .orphanpool import OrphanPool
+from .compactblock import CompactBlock
+from .syncwindow import SyncWindow
 from .lib.queue import Queue
 from .lib.enums  import LogLevel, MsgType, BlockValidationStatus as BlkValStatus
+from .ledger import Ledger, LedgerOverlay
 from .lib.nodeconfig import NodeConf
+from .fragmentpool import FragmentPool
+from .lib.binary import is_hex
+from .wire import WireFormat, encode_message, decode_message, encode_block, encode_blocks_message, fragment_size
 
 
 class Node:
     LOG_DIR = os.path.sep.join([".", "logs"])
+    DATA_DIR = os.path.sep.join([".", "data"])
 
     MAX_BUF_SIZE = pow(2, 21)
+    RCV_BUF_SIZE = pow(2, 23) # socket buffer for bursts of fragments (the OS may cap it, e.g., by net.core.rmem_max)
+    MAX_DATAGRAM_SIZE = 60000 # larger messages are sent in fragments (UDP datagrams are limited to 64 kB)
+    MAX_BLOCKS_PER_REQUEST = 512 # served for one GET_BLOCKS request
 
-    def __init__(self, node_id, conf, priv_key, peers = None, log_level=LogLevel.INFO):
+    LIGHT = False # see LightNode
+
+    ORPHAN_RETRY_INTERVAL = 1 # how long to wait for a requested parent of an orphan block before asking again
+    MAX_PENDING_COMPACT_BLOCKS = 16 # compact blocks waiting for their missing weak headers and txns
+    SYNC_POLL_INTERVAL = 0.1 # how often timed out block requests are checked while syncing
+
+    def __init__(self, node_id, conf, priv_key, peers = None, log_level=LogLevel.INFO, mining_workers=None, fresh_store=False, mempool_size=None):
 
         self.id = node_id
         self.log_level = log_level
@@ -29,11 +48,19 @@ class Node:
         self.priv_key = priv_key
         self.address = conf.address
         self.port = conf.port
-        self.blockchain = Blockchain(self)  # node's blockchain
+        self.blockchain = Blockchain(self,  # node's blockchain
+            BlockStore(self.get_store_filename(), fresh_store), Snapshots(self.get_snapshot_filename(), fresh_store)
+        )
+        self.miner = Miner(mining_workers) # pool of mining processes
+        self.sig_verifier = SigVerifier(mining_workers) # pool of processes verifying signatures of txns
         self.bm = BalanceModel(self, peers)
+        self._restore_blockchain()
         self.peers = peers
-        self.txns_to_mine = set() # current txns to mine on (in json string format due to imutability)
-        self.mined_client_txns = set() # txns sent by our client (in json string format due to imutability)
+        self.mempool = Mempool(self, mempool_size) # current txns to mine on
+        self.client_txns = set() # hashes of txns sent by our client and not mined yet
+        self.orphans = OrphanPool() # received blocks waiting for their parents
+        self.compact_blocks = {} # hash => compact block waiting for its missing weak headers and txns
+        self.fragments = FragmentPool() # chunks of received messages larger than a datagram
 
         # thread-safe queues for client VS mining thread
         self.q_client_txns_mined = Queue()
@@ -49,6 +76,15 @@ class Node:
         self.blockchain_downloaded_event = threading.Event()
 
 
+    def _restore_blockchain(self):
+        restored = self.blockchain.restore()
+        if restored:
+            self.log("Restored {} blocks from {}, length of chain is {}.".format(
+                restored, self.get_store_filename(), self.blockchain.tip_block.length)
+            )
+            self.bm.rebuild_balances_after_fork()
+
+
     def _wait_on_download_of_blockchain(self):
         while not self.blockchain_downloaded_event.is_set():
             time.sleep(0.1)
@@ -57,33 +93,41 @@ class Node:
     def mining_thread(self):
         self.log('Mining thread started')
 
+        self.miner.start()
+        self.sig_verifier.start()
+        self.log('Started {} mining processes'.format(self.miner.n_workers))
         self._wait_on_download_of_blockchain()
 
         while True:
 
-            self._preupdate_mined_txns()
+            self.update_mempool()
+            self.request_missing_blocks()
 
             # start mining
-            mined_block = self.blockchain.mine_next_block(self.pub_key, self.txns_to_mine, self.stop_mining_event)
+            mined_block = self.blockchain.mine_next_block(self.pub_key, self.mempool, self.stop_mining_event)
             if self.stop_mining_event.is_set(): return
 
             if mined_block is not None:
                 # we mined a new block
                 self.blockchain.add_block(mined_block)
                 self.blockchain.tip_block = mined_block
-                self.broadcast(MsgType.STRONG_BLOCK_MINED, mined_block)
+                self.broadcast(MsgType.COMPACT_BLOCK, CompactBlock.from_block(mined_block))
                 self._update_txns_to_mine(mined_block)
                 self.bm.update_balances(mined_block)
             else:
                 # handle received new block
-                rcv_block = self.q_strong.get()
+                rcv_block = self._get_recv_block()
+                if rcv_block is None:
+                    continue
+
                 rcv_block.print_block_info()
                 if not self._validate_recv_block(rcv_block):
                     continue
 
                 self._add_recv_block(rcv_block)
-                self.blockchain.whdrs_cache = {}
+                self.blockchain.clear_whdrs_cache()
                 self._update_txns_to_mine(rcv_block)
+                self._release_orphans(rcv_block)
 
             self.blockchain.print_chain()
             self.bm.print_balances(LogLevel.DEBUG)
@@ -92,6 +136,7 @@ class Node:
     def listening_thread(self):
         self.log("Listening thread started")
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Node.RCV_BUF_SIZE)
         sock.bind(('localhost', self.port,))
         sock.settimeout(1)
         msg_str = None
@@ -108,68 +153,201 @@ class Node:
             except socket.timeout:
                 continue
 
-            msg = json.loads(msg_str)
+            msg = self.decode_message(msg_str)
+            if msg:
+                self._handle_message(msg)
 
-            if  MsgType.WEAK_HEADER_MINED == msg['type']:
-                self.log("[Listening thread]: Received weak header from " + msg['from'][:16])
-                self.q_weak.put(Header.from_json_str(msg['data']))
 
-            elif MsgType.STRONG_BLOCK_MINED == msg['type']:
-                self.log("[Listening thread]: Received strong block from " + msg['from'][:16])
-                self.q_strong.put(Block.from_json_str(self, msg['data']))
+    def _handle_message(self, msg):
+        if  MsgType.WEAK_HEADER_MINED == msg['type']:
+            self.log("[Listening thread]: Received weak header from " + msg['from'][:16])
+            self.q_weak.put(msg['data'])
 
-            elif MsgType.TRANSACTION == msg['type']:
-                self.log("[Listening thread]: Received new TX message from " + msg['from'][:16])
-                self.q_txns_from_others.put(Transaction.from_json_str(msg['data']))
+        elif MsgType.STRONG_BLOCK_MINED == msg['type']:
+            self.log("[Listening thread]: Received strong block from " + msg['from'][:16])
+            self.q_strong.put(msg['data'])
 
-            elif MsgType.GET_BLOCK == msg['type']:
-                self.log("[Listening thread]: Received request for block[{}] from {}.".format(msg['data'], msg['from'][:16]))
-                try:
-                    int(msg['data'])
-                except ValueError:
-                    self.log("[Listening thread]: Block lenght '{}' is not an integer, skipping.".format( msg['data']))
-                    continue
+        elif MsgType.COMPACT_BLOCK == msg['type']:
+            self.log("[Listening thread]: Received compact block from " + msg['from'][:16])
+            msg['data'].sender = msg['from']
+            self.q_strong.put(msg['data'])
 
-                ret_block = self.blockchain.get_block_by_length(int(msg['data']))
-                reply = {
-                    'type': MsgType.BLOCK, 'from': self.pub_key,
-                    'data': ret_block.to_json_str() if ret_block else None
-                }
-                self.send_message(reply, self.find_peer_by_vk(msg['from']))
+        elif MsgType.BLOCK_TXNS == msg['type']:
+            self.log("[Listening thread]: Received missing items of compact block from " + msg['from'][:16])
+            self.q_strong.put(msg['data'])
 
-            elif MsgType.BLOCK == msg['type']:
-                self.log("[Listening thread]: Unexpected block message received from {}, skipping ".format(msg['from'][:16]))
-                continue
+        elif MsgType.TRANSACTION == msg['type']:
+            self.log("[Listening thread]: Received new TX message from " + msg['from'][:16])
+            self.q_txns_from_others.put(msg['data'])
 
-            elif MsgType.NEW_PEER == msg['type']:
-                self.log("[Listening thread]: Received new peer message " + msg['from'][:16])
-                peer = self._add_new_peer(msg["data"])
-                if not peer:
-                    continue # error occured
+        elif MsgType.GET_BLOCK == msg['type']:
+            self.log("[Listening thread]: Received request for block[{}] from {}.".format(msg['data'], msg['from'][:16]))
+            try:
+                int(msg['data'])
+            except ValueError:
+                self.log("[Listening thread]: Block lenght '{}' is not an integer, skipping.".format( msg['data']))
+                return
+
+            ret_block = self.blockchain.get_block_by_length(int(msg['data']))
+            reply = {
+                'type': MsgType.BLOCK, 'from': self.pub_key,
+                'data': ret_block
+            }
+            self.send_message(reply, self.find_peer_by_vk(msg['from']))
+
+        elif MsgType.GET_BLOCKS == msg['type']:
+            try:
+                from_length, count = (int(v) for v in msg['data'])
+            except (TypeError, ValueError):
+                self.log("[Listening thread]: Range of blocks '{}' is not a pair of integers, skipping.".format(msg['data']))
+                return
+
+            self.log("[Listening thread]: Received request for blocks[{}..+{}] from {}.".format(from_length, count, msg['from'][:16]))
+            peer = self._find_requester(msg)
+            if peer is None:
+                return
+            self._send_blocks(peer, from_length, count)
+
+        elif MsgType.GET_BLOCK_BY_HASH == msg['type']:
+            if not Node._is_hash(msg['data']):
+                self.log("[Listening thread]: Block hash '{}' is not a hex string of 32 bytes, skipping.".format(msg['data']))
+                return
+
+            self.log("[Listening thread]: Received request for block {} from {}.".format(msg['data'][:16], msg['from'][:16]))
+            peer = self._find_requester(msg)
+            if peer is None:
+                return
+            reply = {
+                'type': MsgType.BLOCK, 'from': self.pub_key,
+                'data': self.blockchain.all_blocks.get(msg['data'])
+            }
+            self.send_message(reply, peer)
+
+        elif MsgType.GET_BLOCK_TXNS == msg['type']:
+            try:
+                block_hash, whdr_indices, tx_indices = msg['data']
+            except (TypeError, ValueError):
+                block_hash = whdr_indices = tx_indices = None
+            if not Node._is_hash(block_hash) or not all(
+                isinstance(indices, list) and all(type(i) is int and i >= 0 for i in indices) for indices in (whdr_indices, tx_indices)
+            ):
+                self.log("[Listening thread]: Request for items of a compact block '{}' is malformed, skipping.".format(msg['data']))
+                return
+
+            self.log("[Listening thread]: Received request for {} weak headers and {} txns of block {} from {}.".format(
+                len(whdr_indices), len(tx_indices), block_hash[:16], msg['from'][:16])
+            )
+            block = self.blockchain.all_blocks.get(block_hash)
+            if block is None or any(i >= len(block.weak_hdrs) for i in whdr_indices) or any(i >= len(block.txns) for i in tx_indices):
+                self.log("[Listening thread]: Requested items of block {} do not exist, skipping.".format(block_hash[:16]), True)
+                return
+
+            peer = self._find_requester(msg)
+            if peer is None:
+                return
+            reply = {
+                'type': MsgType.BLOCK_TXNS, 'from': self.pub_key,
+                'data': (block_hash, [block.weak_hdrs[i] for i in whdr_indices], [block.txns[i] for i in tx_indices])
+            }
+            self.send_message(reply, peer)
+
+        elif MsgType.GET_HEADERS == msg['type']:
+            self.log("[Listening thread]: Received request for headers from [{}] from {}.".format(msg['data'], msg['from'][:16]))
+            try:
+                int(msg['data'])
+            except (TypeError, ValueError):
+                self.log("[Listening thread]: Header length '{}' is not an integer, skipping.".format(msg['data']))
+                return
+
+            peer = self._find_requester(msg)
+            if peer is None:
+                return
+            reply = {
+                'type': MsgType.HEADERS, 'from': self.pub_key,
+                'data': self.blockchain.get_headers(int(msg['data']))
+            }
+            self.send_message(reply, peer)
+
+        elif MsgType.GET_PROOF == msg['type']:
+            if not Node._is_hash(msg['data']):
+                self.log("[Listening thread]: Tx hash '{}' is not a hex string of 32 bytes, skipping.".format(msg['data']))
+                return
+
+            self.log("[Listening thread]: Received request for proof of Tx {} from {}.".format(msg['data'][:16], msg['from'][:16]))
+            peer = self._find_requester(msg)
+            if peer is None:
+                return
+            reply = {
+                'type': MsgType.PROOF, 'from': self.pub_key,
+                'data': self.blockchain.get_tx_proof(msg['data'])
+            }
+            self.send_message(reply, peer)
+
+        elif MsgType.BLOCK == msg['type']:
+            if msg['data'] is None:
+                self.log("[Listening thread]: Peer {} does not have the requested block".format(msg["from"][:16]), log_level=LogLevel.DEBUG)
+                return
+
+            # a missing parent of an orphan block we asked for, so handle it as a new block
+            self.log("[Listening thread]: Received block[{}] from {}".format(msg['data'].length, msg['from'][:16]))
+            self.q_strong.put(msg['data'])
+
+        elif msg['type'] in [MsgType.BLOCKS, MsgType.HEADERS]:
+            self.log("[Listening thread]: Blocks from {} received after sync, skipping".format(msg['from'][:16]), log_level=LogLevel.DEBUG)
+
+        elif MsgType.NEW_PEER == msg['type']:
+            self.log("[Listening thread]: Received new peer message " + msg['from'][:16])
+            peer = self._add_new_peer(msg["data"])
+            if not peer:
+                return # error occured
+
+            self.log("[Listening thread]: Sending new peer acknowledgement to " + msg['from'][:16])
+            self.send_message({'type': MsgType.NEW_PEER_ACK, 'from': self.pub_key, 'data': self.get_conf()}, peer)
 
-                self.log("[Listening thread]: Sending new peer acknowledgement to " + msg['from'][:16])
-                self.send_message({'type': MsgType.NEW_PEER_ACK, 'from': self.pub_key, 'data': None}, peer)
+        else:
+            self.log("[Listening thread]: Invalid message received. Type = " + str(msg['type']))
 
-            else:
-                self.log("[Listening thread]: Invalid message received. Type = " + msg['type'])
 
+    def _send_blocks(self, peer, from_length, count):
+        """
+            Send mainchain blocks from from_length (at most MAX_BLOCKS_PER_REQUEST) in BLOCKS messages, each fitting
+            into a datagram (a larger block is sent alone, in fragments). Each block is encoded only once.
+        """
+        blocks = self.blockchain.get_blocks(from_length, min(count, Node.MAX_BLOCKS_PER_REQUEST))
+        chain_length = self.blockchain.tip_block.length
+        wire_format = WireFormat.select(peer)
 
-    def _preupdate_mined_txns(self):
+        chunks, size = [[]], 0
+        for block in blocks:
+            encoded = encode_block(block, wire_format)
+            if chunks[-1] and size + len(encoded) > Node.MAX_DATAGRAM_SIZE:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(encoded)
+            size += len(encoded)
+
+        for chunk in chunks: # an empty one tells that we do not have the blocks
+            self._send_datagram(encode_blocks_message(self.pub_key, chain_length, chunk, wire_format), peer, MsgType.BLOCKS)
+
+
+    def update_mempool(self):
+        'Add txns from our client and from peers to the mempool and drop invalid ones.'
 
         # add txns from our client
         while not self.q_txns_from_client.empty():
             tx = self.q_txns_from_client.get()
-            self.txns_to_mine.add(tx.to_json_str())
-            self.mined_client_txns.add(tx.to_json_str())
+            self.mempool.add(tx)
+            self.client_txns.add(tx.hash)
             self.broadcast(MsgType.TRANSACTION, tx)
 
         # add txns broadcasted by other nodes (we do not relay them)
         while not self.q_txns_from_others.empty():
-            tx = self.q_txns_from_others.get()
-            self.txns_to_mine.add(tx.to_json_str())
+            self.mempool.add(self.q_txns_from_others.get())
 
         # filter out invalid Txns (check amounts after block, duplicates, and signatures)
-        self._filter_out_invalid_txns()
+        dropped = self.mempool.revalidate()
+        if dropped:
+            self.log("Dropped {} invalid pending Txns, {} remain".format(dropped, len(self.mempool)), log_level=LogLevel.DEBUG)
 
 
     def find_peer_by_vk(self, vk):
@@ -178,8 +356,24 @@ class Node:
                 return p
         return None
 
-    def _add_new_peer(self, data_str):
-        nc = NodeConf.from_json_str(data_str)
+
+    def _find_requester(self, msg):
+        'The peer to reply to, or None for a sender we do not know (its request is skipped).'
+        peer = self.find_peer_by_vk(msg['from'])
+        if peer is None:
+            self.log("[Listening thread]: Request from unknown peer {}, skipping.".format(msg['from'][:16]), log_level=LogLevel.DEBUG)
+        return peer
+
+
+    @staticmethod
+    def _is_hash(value):
+        'Whether a value received from a peer is a hash (of a block or tx) in hex.'
+        return is_hex(value, 32)
+
+    def get_conf(self):
+        return NodeConf(self.port, self.address, self.pub_key, WireFormat.SUPPORTED)
+
+    def _add_new_peer(self, nc):
         try:
             int(nc.port)
         except ValueError:
@@ -187,95 +381,237 @@ class Node:
             return None
 
         if nc in self.peers:
-            return self.peers[self.peers.index(nc)]
+            peer = self.peers[self.peers.index(nc)]
+            peer.wire, peer.light = nc.wire, nc.light
+            return peer
         else:
             self.log("[Listening thread]: adding a new peer {}".format(str(nc)))
             self.peers.append(nc)
-            self.bm.balances[nc.vk] = 0
+            if self.bm and not nc.vk in self.bm.balances: # a known account keeps its balance from the chain
+                self.bm.balances[nc.vk] = 0
             return nc
 
 
-    def download_blockchain(self, sock):
+    def _handshake_peers(self, sock):
+        'Inform peers about us and return those that are online and serve blocks (i.e., not light nodes).'
         msg = msg_str = None
         online_peers = []
 
-        # inform peers about us and select some online peer (i.e., the last)
         for p in self.peers:
-            my_conf = NodeConf(self.port, self.address, self.pub_key)
-            self.send_message({'type': MsgType.NEW_PEER, 'from': self.pub_key, 'data': my_conf.to_json_str()}, p)
+            self.send_message({'type': MsgType.NEW_PEER, 'from': self.pub_key, 'data': self.get_conf()}, p)
 
             try:
                 # skip other types of messages if any
                 while True:
                     msg_str, addr = sock.recvfrom(Node.MAX_BUF_SIZE)
-                    msg = json.loads(msg_str)
-                    if  MsgType.NEW_PEER_ACK == msg['type']:
+                    msg = self.decode_message(msg_str)
+                    if msg and MsgType.NEW_PEER_ACK == msg['type']:
                         break
             except socket.timeout: # peer is unavailable
                 continue
 
             self.log("[Listening thread]: received acknowledgement of new peer from {}..".format(msg["from"][:16]))
-            online_peers.append(self.find_peer_by_vk(msg["from"]))
+            peer = self.find_peer_by_vk(msg["from"])
+            peer.wire = msg['data'].wire if msg['data'] else None
+            peer.light = msg['data'].light if msg['data'] else False
+            if not peer.light:
+                online_peers.append(peer)
+
+        return online_peers
+
+
+    def download_blockchain(self, sock):
+        """
+            Headers first: download and validate headers of chains of all online peers, and choose the heaviest chain.
+            Then download only blocks of this chain that we do not have, and check them against their headers.
+        """
+        online_peers = self._handshake_peers(sock)
 
         # no peers are online, so we assume that we are the first
         if 0 == len(online_peers):
             self.log("[Listening thread]: No peers are online. We are the first.")
             return
 
-        sock.settimeout(2)
+        sock.settimeout(Node.SYNC_POLL_INTERVAL)
         self.log("[Listening thread]: peers {} are online.".format(str([p.vk[:16] for p in online_peers])))
 
-        # ask for all blocks - balance block requests among all online peers
-        i = 0
-        while not self.stop_listening_event.is_set():
-            i += 1
+        start_time = time.time()
+        headers = HeaderChain(self, self.blockchain)
+        peer_tips = self._sync_headers(sock, online_peers, headers)
+
+        best = headers.best_tip
+        self.log("[Listening thread]: synced headers in {:.2f}s, the heaviest chain has {} blocks.".format(time.time() - start_time, best.length))
+        if best.chain_pow <= self.blockchain.tip_block.chain_pow:
+            self.log("[Listening thread]: our chain is the heaviest one.")
+        else:
+            target = []
+            cur_block = best
+            while not cur_block.header.hash in self.blockchain.all_blocks:
+                target.append(cur_block)
+                cur_block = headers.all_blocks[cur_block.header.prev_hash]
+            target.reverse()
+
+            self._sync_bodies(sock, [p for p in online_peers if peer_tips.get(p.vk) in [b.header.hash for b in target]], target)
+        sock.settimeout(1)
+
+
+    def _sync_headers(self, sock, peers, headers):
+        """
+            Download and validate headers of the chains of peers (strong headers with weak headers) into headers,
+            a HeaderChain, asking all peers at once. When headers of a peer do not connect to its chain known to us,
+            we ask for headers from a lower length (doubling the distance). A peer that does not reply to MAX_REQUESTS
+            requests in a row (each timing out as in SyncWindow) is left out. Returns peer's vk => hash of its last header.
+        """
+        next_length = {p.vk: headers.tip_block.length + 1 for p in peers} # the next header to ask a peer for
+        fork_depth = {p.vk: 0 for p in peers}
+        peer_tips = {}
+        requested = {} # vk => time of the last request
+        unanswered = {p.vk: 0 for p in peers} # vk => number of requests without a reply in a row
+        syncing = {p.vk: p for p in peers}
+
+        while syncing and not self.stop_listening_event.is_set():
+
+            for vk, peer in list(syncing.items()):
+                if time.time() - requested.get(vk, 0) >= SyncWindow.TIMEOUT:
+                    if unanswered[vk] >= SyncWindow.MAX_REQUESTS:
+                        self.log("Peer {} does not reply to requests for headers.".format(vk[:16]), True)
+                        del syncing[vk]
+                        continue
+
+                    from_length = max(Blockchain.GENESIS_LEN + 1, next_length[vk] - fork_depth[vk])
+                    self.send_message({'type': MsgType.GET_HEADERS, 'from': self.pub_key, 'data': from_length}, peer)
+                    requested[vk] = time.time()
+                    unanswered[vk] += 1
 
-            requested_id = self.blockchain.tip_block.length + 1
-            self.send_message({'type': MsgType.GET_BLOCK, 'from': self.pub_key, 'data': requested_id}, online_peers[i % len(online_peers)])
             try:
-                self.log("[Listening thread]: sending get block[{}] request.".format(requested_id))
                 msg_str, addr = sock.recvfrom(Node.MAX_BUF_SIZE)
             except socket.timeout:
-                self.log("[Listening thread]: re-sending get block[{}] request.".format(requested_id))
                 continue
 
-            msg = json.loads(msg_str)
-
-            if  MsgType.BLOCK == msg['type']:
-                # we reached the last block of the peer that we are syncing from
-                if None == msg['data']:
-                    self.log("Peer {} does not have block[{}].".format(i % len(online_peers), requested_id), True)
+            msg = self.decode_message(msg_str)
+            if not msg or MsgType.HEADERS != msg['type'] or not msg['from'] in syncing:
+                continue # ignore all other messages when syncing headers
+            vk = msg['from']
+            requested[vk] = 0 # ask for more right away
+            unanswered[vk] = 0
+            can_go_deeper = next_length[vk] - fork_depth[vk] > Blockchain.GENESIS_LEN + 1
+
+            last = None
+            for block in msg['data'] or []:
+                status = headers.validate_block(block)
+                if BlkValStatus.OK == status:
+                    headers.add_block(block)
+                elif BlkValStatus.NON_EXISTING_PRED == status and last is None and can_go_deeper:
+                    break
+                elif BlkValStatus.EXISTING_BLOCK != status:
+                    self.log("[!!!] Header of block[{}] from {} is invalid with '{}' [!!!]".format(block.length, vk[:16], status.name))
+                    del syncing[vk]
                     break
+                last = block
 
-                self.log("[Listening thread]: Received block[{}] from {}..".format(requested_id, msg['from'][:16]) )
-                rcv_block = Block.from_json_str(self, msg['data'])
-                rcv_block.print_block_info()
+            if last is not None:
+                fork_depth[vk] = 0
+                next_length[vk] = last.length + 1
+                peer_tips[vk] = last.header.hash
 
-                self._validate_recv_block(rcv_block)
-                self._add_recv_block(rcv_block)
+            elif vk in syncing and can_go_deeper and not vk in peer_tips:
+                # the peer's chain forked below the length we asked for (or it is shorter than our chain)
+                fork_depth[vk] = min(max(1, 2 * fork_depth[vk]), next_length[vk] - Blockchain.GENESIS_LEN - 1)
+
+            elif vk in syncing:
+                self.log("Peer {} does not have header[{}].".format(vk[:16], next_length[vk]), True)
+                del syncing[vk]
+
+        headers.tip_block = headers.best_tip
+        return peer_tips
+
+
+    def _sync_bodies(self, sock, peers, target):
+        """
+            Keep a window of requested ranges of blocks of target (blocks without txns, whose headers are validated)
+            spread among peers, add received blocks with these headers in the order of lengths.
+        """
+        start_time, start_len, n_msgs = time.time(), self.blockchain.tip_block.length, 0
+        expected = {b.length: b.header.hash for b in target}
+        window = SyncWindow(peers, target[0].length, to_length=target[-1].length)
+        while not self.stop_listening_event.is_set() and not window.is_done():
+
+            for from_length, count, peer in window.get_requests():
+                self.log("[Listening thread]: sending get blocks[{}..+{}] request to {}.".format(from_length, count, peer.vk[:16]), log_level=LogLevel.DEBUG)
+                self.send_message({'type': MsgType.GET_BLOCKS, 'from': self.pub_key, 'data': (from_length, count)}, peer)
+
+            try:
+                msg_str, addr = sock.recvfrom(Node.MAX_BUF_SIZE)
+            except socket.timeout:
+                continue
+
+            msg = self.decode_message(msg_str)
+            if not msg or not msg['data']:
+                continue
+
+            if MsgType.BLOCKS == msg['type']:
+                chain_length, rcv_blocks = msg['data']
+                n_msgs += 1
+                self.log("[Listening thread]: Received {} blocks from {}.. (its chain has {} blocks)".format(len(rcv_blocks), msg['from'][:16], chain_length))
+                # blocks of another chain (e.g., the peer switched to it meanwhile) are requested again from other peers
+                window.on_blocks(msg['from'], chain_length, [b for b in rcv_blocks if expected.get(b.length) == b.header.hash])
+
+            elif MsgType.BLOCK == msg['type']:
+                self._add_synced_block(msg['data']) # a parent of an orphan, requested by hash
 
             else:
                 continue # ignore all other messages when syncing blockchain
 
-        sock.settimeout(1)
+            for block in window.pop_ready():
+                self._add_synced_block(block)
+
+        # blocks after a gap, which no peer filled, wait for their parents as orphans
+        for block in window.blocks.values():
+            self._add_synced_block(block)
+
+        self.log("[Listening thread]: synced {} blocks in {:.2f}s from {} messages.".format(self.blockchain.tip_block.length - start_len, time.time() - start_time, n_msgs))
+
+
+    def _add_synced_block(self, block):
+        block.print_block_info()
+        if self._validate_recv_block(block):
+            self._add_recv_block(block)
+            self._release_orphans(block)
 
 
     def broadcast(self, msg_type, obj):
+        'Send to all peers except light nodes, which ask for headers and proofs themselves.'
 
-        msg = {'type': msg_type, 'from': self.pub_key, 'data': obj.to_json_str()}
+        msg = {'type': msg_type, 'from': self.pub_key, 'data': obj}
         for peer in self.peers:
-            self.send_message(msg, peer)
+            if not peer.light:
+                self.send_message(msg, peer)
 
 
     def send_message(self, msg, peer):
-        data_sent = 0
+        'The message is encoded in the best wire format supported by the peer.'
+        return self._send_datagram(encode_message(msg, WireFormat.select(peer)), peer, msg['type'])
+
+
+    def _send_datagram(self, datagram, peer, msg_type):
+        'An encoded message larger than MAX_DATAGRAM_SIZE is sent in FRAGMENT messages (see FragmentPool).'
+        if len(datagram) > Node.MAX_DATAGRAM_SIZE:
+            wire_format = WireFormat.select(peer)
+            chunks = FragmentPool.split(datagram, fragment_size(wire_format, Node.MAX_DATAGRAM_SIZE))
+            msg_id = next(self.fragments.ids)
+            self.log("Sending message with type {} to {} in {} fragments".format(msg_type, peer.vk[:16], len(chunks)), log_level=LogLevel.DEBUG)
+            return sum(self._send_datagram(encode_message({
+                    'type': MsgType.FRAGMENT, 'from': self.pub_key, 'data': (msg_id, i, len(chunks), chunk)
+                }, wire_format), peer, MsgType.FRAGMENT) for i, chunk in enumerate(chunks)
+            )
 
+        data_sent = 0
         addr = (peer.address, peer.port)
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            data_sent = sock.sendto(json.dumps(msg).encode(), addr)
+            data_sent = sock.sendto(datagram, addr)
         except Exception as e:
-            self.log("[ERROR] when sending message with type {} to {}.".format(msg['type'], str(addr)), log_level=LogLevel.ERROR)
+            self.log("[ERROR] when sending message with type {} to {}.".format(msg_type, str(addr)), log_level=LogLevel.ERROR)
             self.log("{}".format(str(e)), True, log_level=LogLevel.ERROR)
         finally:
             sock.close()
@@ -283,19 +619,145 @@ class Node:
         return data_sent
 
 
+    def decode_message(self, datagram):
+        'Fragments are collected until their message is complete (None is returned until then).'
+        try:
+            msg = decode_message(self, datagram)
+            if MsgType.FRAGMENT == msg['type']:
+                datagram = self.fragments.add(msg['from'], msg['data'])
+                msg = decode_message(self, datagram) if datagram is not None else None
+            return msg
+        except Exception as e:
+            self.log("[ERROR] malformed message received: {}".format(str(e)), log_level=LogLevel.ERROR)
+            return None
+
+
     def _validate_recv_block(self, rcv_block):
 
+        # signatures are verified in background, while we check PoW and integrity of the block
+        sigs = self.sig_verifier.submit(rcv_block.txns)
+
         status = self.blockchain.validate_block(rcv_block)
+        if BlkValStatus.NON_EXISTING_PRED == status:
+            sigs.cancel()
+            self._add_orphan(rcv_block)
+            return False
+
         if  BlkValStatus.OK != status:
+            sigs.cancel()
             self.log( "[!!!] Validation of strong or weak headers failed with '{}' [!!!]".format(status.name))
+            if BlkValStatus.EXISTING_BLOCK != status:
+                self._drop_orphans_of_invalid(rcv_block)
             return False
 
-        if not self._validate_txns_of_recv_block(rcv_block):
+        if not self._validate_txns_of_recv_block(rcv_block, sigs=sigs):
             self.log("[!!!] Validation of transactions failed [!!!]")
+            self._drop_orphans_of_invalid(rcv_block)
             return False
 
         return True
 
+
+    def _get_recv_block(self):
+        """
+            Take the next received block from q_strong, which holds blocks, compact blocks and replies with missing
+            weak headers and txns of compact blocks (as tuples). A compact block is rebuilt from our weak headers and
+            mempool, and missing items are requested from its sender. Returns None if there is no block to handle yet.
+        """
+        item = self.q_strong.get()
+        if isinstance(item, Block):
+            return item
+
+        if isinstance(item, CompactBlock):
+            compact = item
+            block_hash = compact.header.hash
+            if block_hash in self.blockchain.all_blocks or block_hash in self.compact_blocks:
+                return None
+            compact.fill(self.blockchain.whdrs_cache.values(), self.mempool.txns.values())
+        else: # a reply to GET_BLOCK_TXNS
+            block_hash, weak_hdrs, txns = item
+            compact = self.compact_blocks.pop(block_hash, None)
+            if compact is None:
+                return None
+
+            whdr_indices, tx_indices = compact.get_missing()
+            if len(weak_hdrs) != len(whdr_indices) or len(txns) != len(tx_indices):
+                self.log("[COMPACT] reply for block[{}] does not match the request, skipping".format(compact.length))
+                return None
+
+            for i, wh in zip(whdr_indices, weak_hdrs):
+                compact.whdrs[i] = wh
+            for i, tx in zip(tx_indices, txns):
+                compact.txns[i] = tx
+
+        peer = self.find_peer_by_vk(compact.sender)
+        if peer is None:
+            return None
+
+        whdr_indices, tx_indices = compact.get_missing()
+        if whdr_indices or tx_indices:
+            self.log("[COMPACT] block[{}]: missing {}/{} weak headers and {}/{} txns, requesting them from {}".format(
+                compact.length, len(whdr_indices), len(compact.whdrs), len(tx_indices), len(compact.txns), peer.vk[:16])
+            )
+            self.compact_blocks[block_hash] = compact
+            while len(self.compact_blocks) > Node.MAX_PENDING_COMPACT_BLOCKS:
+                del self.compact_blocks[next(iter(self.compact_blocks))]
+            self.send_message({'type': MsgType.GET_BLOCK_TXNS, 'from': self.pub_key, 'data': (block_hash, whdr_indices, tx_indices)}, peer)
+            return None
+
+        rcv_block = compact.to_block(self)
+        if rcv_block.header.whdrs_hash != Blockchain.compute_whdrs_hash(rcv_block.weak_hdrs) \
+                or not self.blockchain.check_txns_integrity(rcv_block):
+            # a collision of short IDs (or an invalid block), so ask for the full block
+            self.log("[COMPACT] block[{}] does not match its header, requesting the full block from {}".format(compact.length, peer.vk[:16]))
+            self.send_message({'type': MsgType.GET_BLOCK_BY_HASH, 'from': self.pub_key, 'data': block_hash}, peer)
+            return None
+
+        self.log("[COMPACT] rebuilt block[{}] with {} weak headers and {} txns".format(
+            rcv_block.length, len(compact.whdrs), len(compact.txns)), log_level=LogLevel.DEBUG
+        )
+        return rcv_block
+
+
+    def _add_orphan(self, block):
+        'Keep a block with unknown parent until the parent arrives, and ask for the parent.'
+        if not self.orphans.add(block):
+            return
+
+        self.log("[ORPHAN] parent of block[{}] is unknown, {} orphans are waiting".format(block.length, len(self.orphans)))
+        self.request_missing_blocks()
+
+
+    def request_missing_blocks(self):
+        'Ask for missing parents of orphans: first the miner of the orphan, then other peers in turn.'
+        if not self.orphans and not self.orphans.requests:
+            return
+
+        full_peers = [p for p in self.peers if not p.light]
+        if not full_peers:
+            return
+
+        for block_hash, orphan, cnt in self.orphans.get_due_requests(Node.ORPHAN_RETRY_INTERVAL):
+            peer = self.find_peer_by_vk(orphan.header.coinbase)
+            if 0 != cnt or peer is None or peer.light:
+                peer = full_peers[cnt % len(full_peers)]
+
+            self.log("[ORPHAN] requesting block {} (parent of block[{}]) from {}".format(block_hash[:16], orphan.length, peer.vk[:16]), True)
+            self.send_message({'type': MsgType.GET_BLOCK_BY_HASH, 'from': self.pub_key, 'data': block_hash}, peer)
+
+
+    def _release_orphans(self, block):
+        'Orphans waiting for the (just added) block are validated in turn by the mining thread, which releases their orphans.'
+        for orphan in self.orphans.pop_children(block.header.hash):
+            self.log("[ORPHAN] parent of block[{}] arrived".format(orphan.length), True)
+            self.q_strong.put(orphan)
+
+
+    def _drop_orphans_of_invalid(self, block):
+        dropped = self.orphans.remove_descendants(block.header.hash)
+        if dropped:
+            self.log("[ORPHAN] dropped {} orphans descending from invalid block[{}]".format(dropped, block.length), True)
+
     def _add_recv_block(self, rcv_block):
 
         self.blockchain.add_block(rcv_block)
@@ -314,57 +776,52 @@ class Node:
             self.bm.update_balances(rcv_block)
 
 
-    def _validate_txns_of_recv_block(self, rcv_block, other_bm=None):
-        "other_bm: serves selfish miner who wants to check balances of honest chain"
+    def _validate_txns_of_recv_block(self, rcv_block, other_bm=None, sigs=None):
+        """other_bm: serves selfish miner who wants to check balances of honest chain
+           sigs: SigBatch with signatures of the block's txns being already verified
+        """
 
         if len(rcv_block.txns) == 0: return True
 
-        # scan for duplicate Txns in previous blocks
-        relevant_chain = self.blockchain.get_chain(rcv_block.header.prev_hash)
-        if None == relevant_chain:
+        # look up duplicate Txns in previous blocks
+        duplicates = self.blockchain.find_mined_txns([tx.hash for tx in rcv_block.txns], rcv_block.header.prev_hash)
+        if None == duplicates:
             return False
 
-        for tx in rcv_block.txns:
-            for blk in relevant_chain:
-                if  tx.hash in (t.hash for t in blk.txns):
-                    self.log("[ERROR]: Invalid block - duplicate Tx found", True)
-                    return False
+        if duplicates:
+            if sigs: sigs.cancel()
+            self.log("[ERROR]: Invalid block - duplicate Tx found", True)
+            return False
 
         # check each transaction's signature & balance
         bm = self.bm if not other_bm else other_bm
-        if not bm.check_balances_and_sigs(rcv_block.txns):
+        if not bm.check_balances_and_sigs(rcv_block.txns, sigs.result() if sigs else None, rcv_block.header.prev_hash):
             self.log('received block is invalid')
             return False
 
         return True
 
 
-    def _filter_out_invalid_txns(self):
-        if len(self.txns_to_mine) == 0:
-            return
-
-        # filter out duplicates based on history of blockchain
-        main_chain = self.blockchain.get_mainchain()
-        for blk in main_chain:
-            for tx in blk.txns:
-                if tx.to_json_str() in self.txns_to_mine:
-                    self.txns_to_mine.remove(tx.to_json_str())
-
-        # filter out txns with invalid sigantures and amounts
-        self.txns_to_mine = self.bm.filter_out_invalid_txns(self.txns_to_mine)
-
-
     def _update_txns_to_mine(self, new_valid_block):
         'Update our client and remove already mined txns from our pool.'
 
         # inform client if any of its txns were mined
         for tx in new_valid_block.txns:
-            if tx.to_json_str() in self.mined_client_txns:
+            if tx.hash in self.client_txns:
                 self.q_client_txns_mined.put(tx)
-                self.mined_client_txns.remove(tx.to_json_str())
+                self.client_txns.remove(tx.hash)
 
         # remove already mined txns from our pool
-        self.txns_to_mine.difference_update([tx.to_json_str() for tx in new_valid_block.txns])
+        for tx in new_valid_block.txns:
+            self.mempool.remove(tx.hash)
+
+
+    def shutdown(self):
+        'Stop processes of the node (after its threads ended).'
+        self.miner.shutdown()
+        self.sig_verifier.shutdown()
+        if self.blockchain.store:
+            self.blockchain.store.close()
 
 
     def _init_log_file(self):
@@ -387,15 +844,24 @@ class Node:
         return os.path.join(self.LOG_DIR, "node-{}.log".format(self.id))
 
 
+    def get_store_filename(self):
+        return os.path.join(self.DATA_DIR, "node-{}.blocks".format(self.id))
+
+
+    def get_snapshot_filename(self):
+        return os.path.join(self.DATA_DIR, "node-{}.snapshot".format(self.id))
+
+
 class BalanceModel:
 
     def __init__(self, node, peers):
         self.node = node # for logging purposes
         self.balances = self._init_balances(peers) # pub_key => amount //  account balance model
+        self.tip_hash = node.blockchain.get_block_by_length(Blockchain.GENESIS_LEN).header.hash # balances reflect the chain ending with this block
 
 
     def _init_balances(self, peers):
-        balances = {}
+        balances = Ledger(self.node.blockchain.accounts)
         for peer in peers:
             balances[peer.vk] = 0
 
@@ -405,69 +871,82 @@ class BalanceModel:
 
 
     def update_balances(self, new_block):
-        # resolve transactions
-        for tx in new_block.txns:
-            self.balances[tx.sender] -= tx.amount
-            self.balances[tx.receiver] += tx.amount
+        if new_block.header.prev_hash != self.tip_hash:
+            # new_block does not extend our chain
+            self.rebuild_balances_after_fork(new_block)
+            return
 
-        # resolve rewards for strong and weak blocks
-        self.balances[new_block.header.coinbase] += Blockchain.STRONG_BLOCK_REWARD
-        for whdr in new_block.weak_hdrs:
-            self.balances[whdr.coinbase] += whdr.compute_whdr_reward(Blockchain.STRONG_BLOCK_REWARD)
+        # resolve transactions and rewards for strong and weak blocks
+        self._apply_block(new_block)
+        self.tip_hash = new_block.header.hash
 
 
-    def check_balances_and_sigs(self, txns):
+    def _apply_block(self, block, sign=1):
+        blockchain = self.node.blockchain
+        ids, amounts = blockchain.get_balance_deltas(block)
+        self.balances.apply(ids, amounts, sign)
 
-        temp_balances = copy.deepcopy(self.balances)
+        if sign > 0 and blockchain.snapshots.is_due(block):
+            blockchain.snapshots.take(self.balances, block, persist=blockchain.is_in_mainchain(block))
 
-        for tx in txns:
+
+    def check_balances_and_sigs(self, txns, valid_sigs=None, parent_hash=None):
+        """valid_sigs: validity of signatures of txns if already verified (otherwise they are verified in a batch here)
+           parent_hash: txns are checked against balances after this block (default is our tip), e.g., on another chain
+        """
+
+        temp_balances = LedgerOverlay(self.balances)
+        if parent_hash and parent_hash != self.tip_hash:
+            blockchain = self.node.blockchain
+            to_revert, to_apply = blockchain.get_fork_path(blockchain.all_blocks[self.tip_hash], blockchain.all_blocks[parent_hash])
+            for blk in to_revert:
+                temp_balances.apply(*blockchain.get_balance_deltas(blk), -1)
+            for blk in to_apply:
+                temp_balances.apply(*blockchain.get_balance_deltas(blk))
+
+        if valid_sigs is None:
+            valid_sigs = self.node.sig_verifier.verify(txns)
+
+        for tx, valid_sig in zip(txns, valid_sigs):
 
             if tx.amount < 0:
                 self.node.log("Invalid Tx: negative value in amount | Tx = " + tx.to_json_str(), True)
                 return False
 
-            if not tx.validate_sig():
+            if not valid_sig:
                 self.node.log("Validation of signature failed | Tx = " + tx.to_json_str(), True)
                 return False
 
-            temp_balances[tx.sender] -= tx.amount
-            if temp_balances[tx.sender] < 0:
+            amount = Ledger.to_units(tx.amount)
+            temp_balances.add(tx.sender, -amount)
+            if temp_balances.units_of(tx.sender) < 0:
                 self.node.log("Not enough balance for sender {} | Tx = {}".format(tx.sender, tx.to_json_str()), True)
                 return False
 
-            temp_balances[tx.receiver] += tx.amount
+            temp_balances.add(tx.receiver, amount)
 
         return True
 
-    def filter_out_invalid_txns(self, txns):
-        'The validation is dependent on the order of elements in the set.'
-        temp_balances = copy.deepcopy(self.balances)
-        valid_txns = set()
-
-        for tx_str in txns:
-            tx = Transaction.from_json_str(tx_str)
-            if tx.amount < 0:
-                continue
-
-            if not tx.validate_sig():
-                continue
-
-            temp_balances[tx.sender] -= tx.amount
-            if temp_balances[tx.sender] < 0:
-                continue
-
-            temp_balances[tx.receiver] += tx.amount
-            valid_txns.add(tx_str)
+    def rebuild_balances_after_fork(self, tip_block=None):
+        """Move balances to the chain ending with tip_block (default is tip of mainchain): revert undo records
+            of blocks until the fork and apply blocks of the new chain. If it is cheaper, start from the nearest
+            snapshot instead, so the cost is bounded by the depth of fork and by the snapshot interval.
+        """
+        blockchain = self.node.blockchain
+        tip_block = tip_block if tip_block else blockchain.tip_block
+        to_revert, to_apply = blockchain.get_fork_path(blockchain.all_blocks[self.tip_hash], tip_block)
 
-        return valid_txns
+        snapshot, blocks_after = blockchain.snapshots.find(blockchain, tip_block)
+        if snapshot and len(blocks_after) < len(to_revert) + len(to_apply):
+            self.balances.restore(snapshot.addresses, snapshot.units)
+            to_revert, to_apply = [], blocks_after
 
+        for blk in to_revert:
+            self._apply_block(blk, -1)
+        for blk in to_apply:
+            self._apply_block(blk)
 
-    def rebuild_balances_after_fork(self):
-        """TODO: Could be optimized to revert txns backwards - until a block when fork happened.
-            Now, it scans the whole blockchain in the same way as a new node were to compute balances.
-        """
-        for addr in self.balances:
-            self.balances[addr] = self.node.blockchain.get_balance(addr)
+        self.tip_hash = tip_block.header.hash
 
 
     def print_balances(self, _log_level):
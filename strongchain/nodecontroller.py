@@ -3,6 +3,7 @@ from .node import Node
 from .client import Client
 from .lib.enums import LogLevel
 from .selfishnode import SelfishNode
+from .lightnode import LightNode
 
 import threading
 
@@ -15,15 +16,26 @@ class NodeController:
         self.node_id = _id
         self.conf = this_node_conf
 
-        if not args.selfish:
-            self.node = Node(self.node_id + 1, self.conf, sk,
+        if args.light:
+            self.node = LightNode(self.node_id + 1, self.conf, sk,
                 peers = [p for p in self.all_nodes if p.vk != self.conf.vk],
                 log_level = LogLevel.DEBUG if args.verbose else LogLevel.INFO
             )
+        elif not args.selfish:
+            self.node = Node(self.node_id + 1, self.conf, sk,
+                peers = [p for p in self.all_nodes if p.vk != self.conf.vk],
+                log_level = LogLevel.DEBUG if args.verbose else LogLevel.INFO,
+                mining_workers = args.workers,
+                fresh_store = args.fresh,
+                mempool_size = args.mempool_size
+            )
         else:
             self.node = SelfishNode(self.node_id + 1, self.conf, sk,
                 peers = [p for p in self.all_nodes if p.vk != self.conf.vk],
-                log_level = LogLevel.DEBUG if args.verbose else LogLevel.INFO
+                log_level = LogLevel.DEBUG if args.verbose else LogLevel.INFO,
+                mining_workers = args.workers,
+                fresh_store = args.fresh,
+                mempool_size = args.mempool_size
             )
         self.client = Client(self.conf.vk, sk, self.node)
         self.child_threads = []
@@ -73,6 +85,7 @@ class NodeController:
 
     def _mining_thread_wrapper(self, t_name):
         self.node.mining_thread()
+        self.node.shutdown()
         print(" [INFO]: {} terminated.".format(t_name))
 
 
@@ -0,0 +1,101 @@
+import time
+import collections
+
+
+class OrphanPool:
+    """
+        Received blocks whose parents are not known yet, indexed by the hash of the missing parent. When the parent
+        is added to the chain, its orphans are released (and then their orphans, etc.). Missing blocks are requested
+        by hash, at most MAX_REQUESTS times each; orphans waiting for a block that was not obtained are dropped.
+        At most max_size orphans are kept; when full, the oldest one is evicted.
+    """
+
+    MAX_SIZE = 128
+    MAX_REQUESTS = 5
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or OrphanPool.MAX_SIZE
+        self.blocks = collections.OrderedDict() # hash => orphan block (in the order of arrival)
+        self.by_parent = {} # hash of parent => {hash of orphan => orphan block}
+        self.requests = {} # hash of missing block => (time of the last request, number of requests)
+
+
+    def add(self, block):
+        'Return False if the block is already waiting.'
+        block_hash = block.header.hash
+        if block_hash in self.blocks:
+            return False
+
+        self.blocks[block_hash] = block
+        self.by_parent.setdefault(block.header.prev_hash, {})[block_hash] = block
+        self.requests.pop(block_hash, None) # it is not missing anymore, its parent is
+
+        while len(self.blocks) > self.max_size:
+            self._remove(next(iter(self.blocks)))
+        return block_hash in self.blocks
+
+
+    def pop_children(self, parent_hash):
+        'Remove and return orphans waiting for the block with parent_hash (in the order of arrival).'
+        children = self.by_parent.pop(parent_hash, {})
+        for block_hash in children:
+            del self.blocks[block_hash]
+            self.requests[block_hash] = (time.time(), 0) # being connected, so do not request it as missing right away
+        self.requests.pop(parent_hash, None)
+        return list(children.values())
+
+
+    def remove_descendants(self, block_hash):
+        'Drop all orphans descending from the block (e.g., when it is invalid). Returns the number of dropped orphans.'
+        dropped = 0
+        stack = [block_hash]
+        while stack:
+            for child in self.pop_children(stack.pop()):
+                stack.append(child.header.hash)
+                dropped += 1
+        return dropped
+
+
+    def get_due_requests(self, retry_interval):
+        """
+            Hashes of missing blocks (parents of orphans, which are not orphans themselves) that were not requested
+            in the last retry_interval seconds, each with one of its orphans and the number of previous requests.
+            They are marked as requested now. Orphans of blocks requested MAX_REQUESTS times are dropped.
+        """
+        now = time.time()
+        due = []
+        for parent_hash in list(self.by_parent):
+            if parent_hash in self.blocks or not parent_hash in self.by_parent:
+                continue
+
+            last_time, cnt = self.requests.get(parent_hash, (0, 0))
+            if now - last_time < retry_interval:
+                continue
+
+            if cnt >= OrphanPool.MAX_REQUESTS:
+                self.remove_descendants(parent_hash)
+                continue
+
+            self.requests[parent_hash] = (now, cnt + 1)
+            due.append((parent_hash, next(iter(self.by_parent[parent_hash].values())), cnt))
+
+        for block_hash in [h for h in self.requests if not h in self.by_parent]:
+            del self.requests[block_hash] # nobody waits for it anymore
+        return due
+
+
+    def _remove(self, block_hash):
+        block = self.blocks.pop(block_hash)
+        siblings = self.by_parent[block.header.prev_hash]
+        del siblings[block_hash]
+        if not siblings:
+            del self.by_parent[block.header.prev_hash]
+            self.requests.pop(block.header.prev_hash, None)
+
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+    def __contains__(self, block_hash):
+        return block_hash in self.blocks
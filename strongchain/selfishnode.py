@@ -10,26 +10,32 @@ class SelfishNode(Node):
     # represents the ratio of received block's POW (only for strong target), with which (and with the lower values) we reveal our secret chain
     RATIO_TO_OVERRIDE = 1/8
 
-    def __init__(self, node_id, conf, priv_key, peers = None, log_level=LogLevel.INFO):
-        Node.__init__(self, node_id, conf, priv_key, peers, log_level)
+    def __init__(self, node_id, conf, priv_key, peers = None, log_level=LogLevel.INFO, mining_workers=None, fresh_store=False, mempool_size=None):
+        Node.__init__(self, node_id, conf, priv_key, peers, log_level, mining_workers, fresh_store, mempool_size)
         self.log("Selfish node started.")
 
         # serves for selfish miner, who can validate balances of honest chain, too
         self.honest_bm = BalanceModel(self, peers)
+        self.honest_bm.rebuild_balances_after_fork()
 
 
     def mining_thread(self):
 
         self.log('Mining thread of selfish node started')
+
+        self.miner.start()
+        self.sig_verifier.start()
+        self.log('Started {} mining processes'.format(self.miner.n_workers))
         self._wait_on_download_of_blockchain()
 
         fork_mark = None
         while True:
 
-            self._preupdate_mined_txns()
+            self.update_mempool()
+            self.request_missing_blocks()
 
             # start mining
-            mined_block = self.blockchain.mine_next_block(self.pub_key, self.txns_to_mine, self.stop_mining_event, broadcast_whdrs=False)
+            mined_block = self.blockchain.mine_next_block(self.pub_key, self.mempool, self.stop_mining_event, broadcast_whdrs=False)
             if self.stop_mining_event.is_set(): return
 
             if mined_block is not None:
@@ -41,12 +47,16 @@ class SelfishNode(Node):
                 self.bm.update_balances(mined_block)
             else:
                 # handle received new block
-                rcv_block = self.q_strong.get()
+                rcv_block = self._get_recv_block()
+                if rcv_block is None:
+                    continue
+
                 rcv_block.print_block_info()
                 if not self._validate_recv_block(rcv_block):
                     continue
 
                 state = self._add_or_ignore_block(rcv_block, fork_mark)
+                self._release_orphans(rcv_block)
                 if SMState.PUBLISH == state:
                     fork_mark = self.blockchain.tip_block
 
@@ -55,7 +65,7 @@ class SelfishNode(Node):
 
                 elif SMState.GIVE_UP == state:
                     # we lost and we need to fork to a valid chain
-                    self.blockchain.whdrs_cache = {}
+                    self.blockchain.clear_whdrs_cache()
                     self._update_txns_to_mine(rcv_block)
                     fork_mark = self.blockchain.tip_block
 
@@ -75,10 +85,12 @@ class SelfishNode(Node):
             self.log("Adding block to another chain", True)
 
 
+            honest_pow = self.blockchain.chainPoW(rcv_block)
+            selfish_pow = self.blockchain.chainPoW() + self.blockchain.current_whdrs_PoW()
+
             # if honest chain is almost "catching up" with our selfish chain, then broadcast our selfish branch
-            if self.blockchain.chainPoW(rcv_block)  > self.blockchain.chainPoW() + self.blockchain.current_whdrs_PoW() \
-                        - SelfishNode.RATIO_TO_OVERRIDE * (Header.MAX_TARGET * rcv_block.header.target) \
-                        and self.blockchain.chainPoW(rcv_block) < self.blockchain.chainPoW() + self.blockchain.current_whdrs_PoW():
+            if honest_pow > selfish_pow - SelfishNode.RATIO_TO_OVERRIDE * (Header.MAX_TARGET * rcv_block.header.target) \
+                        and honest_pow < selfish_pow:
 
                 self.log(80 * 'X')
                 self.log("[XXX] REVEALING HIDDEN CHAIN [XXX]")
@@ -99,7 +111,7 @@ class SelfishNode(Node):
 
                 return SMState.PUBLISH
 
-            elif self.blockchain.chainPoW(rcv_block) < self.blockchain.chainPoW() + self.blockchain.current_whdrs_PoW():
+            elif honest_pow < selfish_pow:
                 self.log("[XXX] We continue in witholding [XXX]")
                 self.honest_bm.update_balances(rcv_block)
                 return SMState.WITHOLD
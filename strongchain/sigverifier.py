@@ -0,0 +1,94 @@
+import os
+import multiprocessing
+from concurrent.futures import BrokenExecutor, CancelledError, ProcessPoolExecutor
+
+from .transaction import Transaction
+from .lib.lrucache import LRUCache
+
+
+class SigVerifier:
+    """
+        Pool of processes verifying ECDSA signatures of transactions in batches. A batch is split into
+        one chunk per worker and verified in the background, so the caller can meanwhile run other checks.
+        Small batches (and all batches before start() or after a failure of the pool) are verified in the calling thread.
+        Results are cached by (tx hash, signature), so txns seen before (e.g., pending ones) are not verified again.
+    """
+
+    MIN_PARALLEL_BATCH = 8 # smaller batches are not worth the inter-process communication
+    CACHE_SIZE = 100000
+
+    def __init__(self, n_workers=None):
+        self.n_workers = max(1, n_workers or os.cpu_count() or 1)
+        self.cache = LRUCache(SigVerifier.CACHE_SIZE) # (tx hash, signature) => validity of the signature
+        self._ctx = multiprocessing.get_context('spawn')
+        self._pool = None
+
+
+    def start(self):
+        if self._pool:
+            return
+
+        self._pool = ProcessPoolExecutor(self.n_workers, mp_context=self._ctx)
+        for _ in range(self.n_workers):
+            self._pool.submit(int) # spawn the workers before the first batch arrives
+
+
+    def submit(self, txns):
+        'Start verification of signatures of txns; result() of the returned batch lists validity of each signature.'
+        known = [self.cache.get((tx.hash, tx.signature)) for tx in txns]
+        items = [(tx.sender, tx.signature, tx.hash) for tx, valid in zip(txns, known) if valid is None]
+        if self._pool is None or len(items) < SigVerifier.MIN_PARALLEL_BATCH:
+            return SigBatch(self.cache, known, items)
+
+        chunk = -(-len(items) // self.n_workers)
+        try:
+            futures = [self._pool.submit(_verify_chunk, items[i : i + chunk]) for i in range(0, len(items), chunk)]
+        except (RuntimeError, BrokenExecutor): # pool is shut down or broken
+            return SigBatch(self.cache, known, items)
+        return SigBatch(self.cache, known, items, futures)
+
+
+    def verify(self, txns):
+        return self.submit(txns).result()
+
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class SigBatch:
+    'Signatures of a batch of txns being verified; known holds cached results (None for items being verified).'
+
+    def __init__(self, cache, known, items, futures=None):
+        self.cache = cache
+        self.known = known
+        self.items = items
+        self.futures = futures
+        self._result = None
+
+
+    def result(self):
+        'Wait for the verification and return a list of booleans (in the order of txns).'
+        if self._result is None:
+            try:
+                verified = [ok for f in self.futures for ok in f.result()] if self.futures else _verify_chunk(self.items)
+            except (CancelledError, BrokenExecutor):
+                verified = _verify_chunk(self.items)
+
+            for (_, signature, tx_hash), valid in zip(self.items, verified):
+                self.cache.put((tx_hash, signature), valid)
+
+            verified = iter(verified)
+            self._result = [next(verified) if valid is None else valid for valid in self.known]
+        return self._result
+
+
+    def cancel(self):
+        for f in self.futures or []:
+            f.cancel()
+
+
+def _verify_chunk(items):
+    return [Transaction.verify_sig(sender, signature, tx_hash) for sender, signature, tx_hash in items]
@@ -0,0 +1,105 @@
+import os
+import json
+import collections
+
+import numpy as np
+
+
+class Snapshot:
+    'Balances of all accounts (in Ledger units) after the block with hash tip_hash.'
+
+    __slots__ = ('tip_hash', 'length', 'addresses', 'units')
+
+    def __init__(self, tip_hash, length, addresses, units):
+        self.tip_hash = tip_hash
+        self.length = length
+        self.addresses = addresses
+        self.units = units
+
+
+    def get_units(self, address):
+        try:
+            return int(self.units[self.addresses.index(address)])
+        except ValueError:
+            return 0
+
+
+    def to_json(self):
+        return {
+            'tip_hash' : self.tip_hash,
+            'length' : self.length,
+            'balances' : dict(zip(self.addresses, (int(u) for u in self.units)))
+        }
+
+    @classmethod
+    def from_json(cls, j):
+        balances = j.get('balances')
+        return cls(j.get('tip_hash'), j.get('length'), list(balances.keys()),
+            np.fromiter(balances.values(), dtype=np.int64, count=len(balances))
+        )
+
+
+class Snapshots:
+    """
+        State snapshots taken every INTERVAL blocks. The latest KEEP snapshots are kept in memory,
+        the latest one of mainchain is also written to path (if any).
+    """
+
+    INTERVAL = 50
+    KEEP = 4
+
+    def __init__(self, path=None, fresh=False):
+        self.path = path
+        self._snapshots = collections.OrderedDict() # tip hash => Snapshot
+
+        if path and not fresh:
+            self._load()
+
+
+    def is_due(self, block):
+        return 0 == block.length % Snapshots.INTERVAL and not block.header.hash in self._snapshots
+
+
+    def take(self, ledger, block, persist=False):
+        addresses, units = ledger.export()
+        self.add(Snapshot(block.header.hash, block.length, addresses, units))
+        if persist and self.path:
+            self._save(self._snapshots[block.header.hash])
+
+
+    def add(self, snapshot):
+        self._snapshots[snapshot.tip_hash] = snapshot
+        while len(self._snapshots) > Snapshots.KEEP:
+            self._snapshots.popitem(last=False)
+
+
+    def find(self, blockchain, tip_block):
+        'The nearest snapshot on the chain ending with tip_block and blocks after it (in order). Walks back at most KEEP * INTERVAL blocks.'
+        blocks_after = []
+        cur_block = tip_block
+
+        for _ in range(Snapshots.KEEP * Snapshots.INTERVAL + 1):
+            if cur_block.header.hash in self._snapshots:
+                return self._snapshots[cur_block.header.hash], blocks_after[::-1]
+            if not cur_block.header.prev_hash in blockchain.all_blocks:
+                break
+            blocks_after.append(cur_block)
+            cur_block = blockchain.all_blocks[cur_block.header.prev_hash]
+
+        return None, None
+
+
+    def _save(self, snapshot):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot.to_json(), f)
+        os.replace(tmp_path, self.path)
+
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path) as f:
+            self.add(Snapshot.from_json(json.load(f)))
@@ -0,0 +1,119 @@
+import time
+
+
+class SyncWindow:
+    """
+        Sliding window of GET_BLOCKS requests for downloading the chain from several peers at once. At most size
+        blocks are requested or received but not yet handed over; ranges of batch blocks are requested from peers
+        in turn and received blocks are handed over in the order of their lengths. A block without reply for TIMEOUT
+        seconds is requested from another peer (at most MAX_REQUESTS times). Each BLOCKS reply carries the length
+        of the peer's chain, so blocks beyond it are requested from other peers; the download is done when
+        no peer has the next block.
+    """
+
+    SIZE = 256
+    BATCH = 64
+    TIMEOUT = 1
+    MAX_REQUESTS = 5
+
+    def __init__(self, peers, from_length, size=None, batch=None, to_length=None):
+        self.peers = list(peers)
+        self.to_length = to_length # the last length to download (if any)
+        self.size = size or SyncWindow.SIZE
+        self.batch = batch or SyncWindow.BATCH
+        self.next_length = from_length # the lowest length not requested yet
+        self.next_to_pop = from_length # the lowest length not handed over yet
+        self.pending = {} # length => (peer, time of the last request, number of requests)
+        self.blocks = {} # length => received block, waiting for blocks with lower lengths
+        self.ends = {} # peer's vk => length of the first block the peer does not have
+        self.failed = False # a block was requested MAX_REQUESTS times without a reply
+        self.i = 0
+
+
+    def get_requests(self):
+        'Ranges to request now as (from length, count, peer): the timed out blocks and new ones that fit into the window.'
+        now = time.time()
+        requests = []
+
+        for length, (peer, req_time, cnt) in sorted(self.pending.items()):
+            if now - req_time < SyncWindow.TIMEOUT:
+                continue
+
+            peers = self._peers_having(length)
+            if not peers: # all peers ended their chains below
+                del self.pending[length]
+                continue
+
+            if cnt >= SyncWindow.MAX_REQUESTS:
+                del self.pending[length]
+                self.failed = True
+                continue
+
+            peer = peers[(peers.index(peer) + 1) % len(peers)] if peer in peers else peers[0]
+            self.pending[length] = (peer, now, cnt + 1)
+            self._append_to_ranges(requests, length, peer)
+
+        while len(self.pending) + len(self.blocks) < self.size:
+            peers = self._peers_having(self.next_length)
+            if not peers:
+                break
+
+            self.i += 1
+            peer = peers[self.i % len(peers)]
+            count = min(self.batch, self.size - len(self.pending) - len(self.blocks))
+            if self.to_length is not None:
+                count = min(count, self.to_length - self.next_length + 1)
+            for length in range(self.next_length, self.next_length + count):
+                self.pending[length] = (peer, now, 1)
+            requests.append((self.next_length, count, peer))
+            self.next_length += count
+
+        return requests
+
+
+    @staticmethod
+    def _append_to_ranges(ranges, length, peer):
+        if ranges and ranges[-1][2] is peer and ranges[-1][0] + ranges[-1][1] == length:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + 1, peer)
+        else:
+            ranges.append((length, 1, peer))
+
+
+    def on_blocks(self, peer_vk, chain_length, blocks):
+        """
+            Record blocks from a BLOCKS reply of the peer, whose chain has chain_length blocks (requests for blocks
+            beyond it are moved to other peers). Returns blocks that were not requested (e.g., received twice).
+        """
+        self.ends[peer_vk] = chain_length + 1
+        for length, (peer, _, cnt) in self.pending.items():
+            if peer.vk == peer_vk and length > chain_length:
+                self.pending[length] = (peer, 0, cnt) # time out right away
+
+        unexpected = []
+        for block in blocks:
+            if block.length in self.pending:
+                del self.pending[block.length]
+                self.blocks[block.length] = block
+            elif not (block.length in self.blocks and self.blocks[block.length].header.hash == block.header.hash):
+                unexpected.append(block)
+        return unexpected
+
+
+    def pop_ready(self):
+        'Received blocks that follow the already handed over ones (in the order of lengths).'
+        ready = []
+        while self.next_to_pop in self.blocks:
+            ready.append(self.blocks.pop(self.next_to_pop))
+            self.next_to_pop += 1
+        return ready
+
+
+    def is_done(self):
+        'Blocks still waiting for lower lengths (if any) can be obtained only as orphans.'
+        return self.failed or (not self.pending and not self._peers_having(self.next_length))
+
+
+    def _peers_having(self, length):
+        if self.to_length is not None and length > self.to_length:
+            return []
+        return [p for p in self.peers if self.ends.get(p.vk, length + 1) > length]
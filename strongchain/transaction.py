@@ -1,15 +1,30 @@
+import sys
 import json
+import struct
 import ecdsa
 import hashlib
 
+from .lib.binary import BinaryReader, BinaryWriter, is_hex
+from .lib.lrucache import LRUCache
+
 class Transaction:
 
+    __slots__ = ('sender', 'receiver', 'amount', 'comment', 'signature', '_hash')
+
+    ADDRESS_SIZE = 48 # verifying key (NIST192p) of sender or receiver in bytes
+    AMOUNT_LAYOUT = struct.Struct('>d')
+
+    HASHED_FIELDS = frozenset(['sender', 'receiver', 'amount', 'comment'])
+
+    VK_CACHE = LRUCache(1024) # sender => parsed ecdsa.VerifyingKey (per process)
+
     def __init__(self, sender_pk, receiver_pk, amount, signature, comment=''):
-        self.sender = sender_pk
-        self.receiver = receiver_pk
+        self.sender = sys.intern(sender_pk) if sender_pk else sender_pk
+        self.receiver = sys.intern(receiver_pk) if receiver_pk else receiver_pk
         self.amount = amount
         self.comment = comment
         self.signature = signature
+        self._hash = None
 
 
     def to_json(self):
@@ -29,8 +44,18 @@ class Transaction:
     def __str__(self):
         return self.to_json_str()
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in Transaction.HASHED_FIELDS:
+            object.__setattr__(self, '_hash', None) # invalidate the cached hash
+
     @property
     def hash(self):
+        if self._hash is None:
+            self._hash = self.compute_hash()
+        return self._hash
+
+    def compute_hash(self):
         to_hash = {'sender': self.sender,
                      'receiver': self.receiver,
                      'amount': self.amount,
@@ -40,19 +65,34 @@ class Transaction:
 
 
     def validate_sig(self):
-        local_msg = self.hash
-        msg_byte = str(local_msg).encode('utf-8')
+        return Transaction.verify_sig(self.sender, self.signature, self.hash)
+
+
+    @staticmethod
+    def verify_sig(sender, signature, tx_hash):
+        'Check the signature of a tx with the given hash by the sender (it runs in processes of SigVerifier, too).'
+        msg_byte = str(tx_hash).encode('utf-8')
 
         try:
-            vk = ecdsa.VerifyingKey.from_string(bytes.fromhex(self.sender), curve = ecdsa.NIST192p)
-            if vk.verify(bytes.fromhex(self.signature), msg_byte):
+            vk = Transaction.get_verifying_key(sender)
+            if vk.verify(bytes.fromhex(signature), msg_byte):
                 return True
-        except ecdsa.keys.BadSignatureError:
+        except (ecdsa.keys.BadSignatureError, ecdsa.keys.MalformedPointError, ValueError, TypeError): # also malformed key or missing signature
             pass
 
         return False
 
 
+    @staticmethod
+    def get_verifying_key(sender):
+        'Parsed key of the sender (decoding and validation of its point is done once per sender).'
+        vk = Transaction.VK_CACHE.get(sender)
+        if vk is None:
+            vk = ecdsa.VerifyingKey.from_string(bytes.fromhex(sender), curve = ecdsa.NIST192p)
+            Transaction.VK_CACHE.put(sender, vk)
+        return vk
+
+
     def __eq__(self, other):
         return self.amount == int(other.amount) and \
                self.sender == other.sender and \
@@ -61,11 +101,44 @@ class Transaction:
                self.comment == other.comment
 
 
+    @staticmethod
+    def is_address(value):
+        'Whether a value (e.g., sender or receiver of a tx from a peer) is a verifying key in hex.'
+        return is_hex(value, Transaction.ADDRESS_SIZE)
+
+    def has_valid_addresses(self):
+        return Transaction.is_address(self.sender) and Transaction.is_address(self.receiver)
+
+
     @classmethod
     def from_json(cls, j):
+        if not (Transaction.is_address(j.get("sender")) and Transaction.is_address(j.get("receiver"))):
+            raise ValueError("sender or receiver of tx is not an address")
         return cls(j.get("sender"), j.get("receiver"), float(j.get("amount")), j.get("signature"), j.get("comment"))
 
 
+    def write_to(self, w):
+        'Fixed-size fields (sender, receiver, amount) followed by comment and signature.'
+        return w.hex(self.sender, Transaction.ADDRESS_SIZE).hex(self.receiver, Transaction.ADDRESS_SIZE) \
+            .fixed(Transaction.AMOUNT_LAYOUT, self.amount) \
+            .str(self.comment or '').bytes(bytes.fromhex(self.signature) if self.signature else b'')
+
+    def to_bytes(self):
+        return self.write_to(BinaryWriter()).to_bytes()
+
+
+    @classmethod
+    def read_from(cls, r):
+        sender, receiver = r.hex(Transaction.ADDRESS_SIZE), r.hex(Transaction.ADDRESS_SIZE)
+        amount, = r.fixed(Transaction.AMOUNT_LAYOUT)
+        comment, signature = r.str(), r.bytes()
+        return cls(sender, receiver, amount, signature.hex() if signature else None, comment)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.read_from(BinaryReader(data))
+
+
     @classmethod
     def from_json_str(cls, json_string):
         j = json.loads(json_string)
@@ -0,0 +1,61 @@
+import struct
+
+from .merkletree import verify_proof
+from .lib.binary import BinaryReader, BinaryWriter
+
+
+class TxProof:
+    'Merkle proof that the tx with tx_hash is the index-th txn of the block with block_hash (and length).'
+
+    __slots__ = ('tx_hash', 'block_hash', 'length', 'index', 'path')
+
+    PATH_ITEM = struct.Struct('>c32s') # side of sibling ('l' or 'r') and its hash
+
+    def __init__(self, tx_hash, block_hash, length, index, path):
+        self.tx_hash = tx_hash
+        self.block_hash = block_hash
+        self.length = length
+        self.index = index
+        self.path = path # [[sibling hash, side], ...] from the leaf up (see MerkleTree.get_proof())
+
+
+    def verify(self, tx, header):
+        return tx.hash == self.tx_hash and header.hash == self.block_hash and verify_proof(tx, self.path, header.root)
+
+
+    def to_json(self):
+        return {
+            'tx_hash' : self.tx_hash,
+            'block_hash' : self.block_hash,
+            'length' : self.length,
+            'index' : self.index,
+            'path' : self.path
+        }
+
+    @classmethod
+    def from_json(cls, j):
+        return cls(j.get('tx_hash'), j.get('block_hash'), int(j.get('length')), int(j.get('index')), [list(item) for item in j.get('path')])
+
+
+    def write_to(self, w):
+        w.hex(self.tx_hash, 32).hex(self.block_hash, 32).varint(self.length).varint(self.index).varint(len(self.path))
+        for sibling, side in self.path:
+            w.fixed(TxProof.PATH_ITEM, side.encode(), bytes.fromhex(sibling))
+        return w
+
+    def to_bytes(self):
+        return self.write_to(BinaryWriter()).to_bytes()
+
+
+    @classmethod
+    def read_from(cls, r):
+        tx_hash, block_hash, length, index = r.hex(32), r.hex(32), r.varint(), r.varint()
+        path = []
+        for _ in range(r.varint()):
+            side, sibling = r.fixed(TxProof.PATH_ITEM)
+            path.append([sibling.hex(), side.decode()])
+        return cls(tx_hash, block_hash, length, index, path)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls.read_from(BinaryReader(data))
@@ -0,0 +1,181 @@
+import json
+import base64
+
+from .block import Block
+from .header import Header
+from .transaction import Transaction
+from .txproof import TxProof
+from .compactblock import CompactBlock
+from .lib.enums import MsgType
+from .lib.binary import BinaryReader, BinaryWriter
+from .lib.nodeconfig import NodeConf
+
+
+class WireFormat:
+    """
+        Encoding of messages exchanged among peers. JSON is understood by every node; binary versions
+        are announced in NEW_PEER handshake (NodeConf.wire) and used with peers that support them.
+
+        Binary message: MAGIC, version (varint), type (varint), sender's key (48 B), payload.
+        Since BINARY_V2, weak headers in blocks are sent without prev_hash and target, which they share with their
+        block; gossiped weak headers are sent without target, which the receiver fills in from its template.
+    """
+    JSON      = 0
+    BINARY_V1 = 1
+    BINARY_V2 = 2
+
+    SUPPORTED = [BINARY_V1, BINARY_V2] # binary versions supported by this node
+
+    MAGIC = b'\x00SC' # JSON messages start with '{'
+
+    HANDSHAKE = [MsgType.NEW_PEER, MsgType.NEW_PEER_ACK] # always in JSON, as the peer's formats are not known yet
+
+    @staticmethod
+    def select(peer):
+        'The newest format supported by both this node and the peer.'
+        common = set(peer.wire or []) & set(WireFormat.SUPPORTED)
+        return max(common) if common else WireFormat.JSON
+
+
+# msg type => (encode data to JSON-compatible value, decode it back)
+JSON_CODECS = {
+    MsgType.STRONG_BLOCK_MINED : (lambda blk: blk.to_json_str(), lambda node, s: Block.from_json_str(node, s)),
+    MsgType.WEAK_HEADER_MINED  : (lambda wh: wh.to_json_str(), lambda node, s: Header.from_json_str(s)),
+    MsgType.NEW_PEER           : (lambda nc: nc.to_json_str(), lambda node, s: NodeConf.from_json_str(s)),
+    MsgType.NEW_PEER_ACK       : (lambda nc: nc.to_json_str(), lambda node, s: NodeConf.from_json_str(s)),
+    MsgType.TRANSACTION        : (lambda tx: tx.to_json_str(), lambda node, s: Transaction.from_json_str(s)),
+    MsgType.GET_BLOCK          : (lambda length: length, lambda node, length: length),
+    MsgType.BLOCK              : (lambda blk: blk.to_json_str(), lambda node, s: Block.from_json_str(node, s)),
+    MsgType.GET_HEADERS        : (lambda length: length, lambda node, length: length),
+    MsgType.HEADERS            : (lambda blks: [b.to_json_str() for b in blks], lambda node, l: [Block.from_json_str(node, s) for s in l]),
+    MsgType.GET_PROOF          : (lambda tx_hash: tx_hash, lambda node, tx_hash: tx_hash),
+    MsgType.PROOF              : (lambda proof: proof.to_json(), lambda node, j: TxProof.from_json(j)),
+    MsgType.GET_BLOCK_BY_HASH  : (lambda block_hash: block_hash, lambda node, block_hash: block_hash),
+    MsgType.GET_BLOCKS         : (lambda rng: list(rng), lambda node, l: tuple(l)),
+    MsgType.BLOCKS             : (lambda rep: {'length' : rep[0], 'blocks' : [b.to_json_str() for b in rep[1]]},
+                                  lambda node, j: (j['length'], [Block.from_json_str(node, s) for s in j['blocks']])),
+    MsgType.COMPACT_BLOCK      : (lambda cb: cb.to_json_str(), lambda node, s: CompactBlock.from_json_str(s)),
+    MsgType.GET_BLOCK_TXNS     : (lambda req: list(req), lambda node, l: tuple(l)),
+    MsgType.BLOCK_TXNS         : (lambda rep: {'hash' : rep[0], 'weak_hdrs' : [wh.to_json() for wh in rep[1]], 'txns' : [tx.to_json() for tx in rep[2]]},
+                                  lambda node, j: (j['hash'], [Header.from_json(wh) for wh in j['weak_hdrs']], [Transaction.from_json(tx) for tx in j['txns']])),
+    MsgType.FRAGMENT           : (lambda f: {'id' : f[0], 'index' : f[1], 'count' : f[2], 'chunk' : base64.b64encode(f[3]).decode()},
+                                  lambda node, j: (j['id'], j['index'], j['count'], base64.b64decode(j['chunk']))),
+}
+
+def write_blocks(w, blocks, delta_whdrs=True):
+    w.varint(len(blocks))
+    for b in blocks:
+        b.write_to(w, delta_whdrs)
+    return w
+
+def read_blocks(node, r, delta_whdrs=True):
+    return [Block.read_from(node, r, delta_whdrs) for _ in range(r.varint())]
+
+def write_items(w, items):
+    w.varint(len(items))
+    for item in items:
+        item.write_to(w)
+    return w
+
+def write_varints(w, values):
+    w.varint(len(values))
+    for v in values:
+        w.varint(v)
+    return w
+
+def read_varints(r):
+    return [r.varint() for _ in range(r.varint())]
+
+def encode_block(block, wire_format):
+    'The block as encoded in BLOCKS messages of the given format (see encode_blocks_message()).'
+    if WireFormat.JSON == wire_format:
+        return json.dumps(block.to_json_str()).encode()
+    return block.to_bytes(WireFormat.BINARY_V2 <= wire_format)
+
+
+def encode_blocks_message(sender, chain_length, encoded_blocks, wire_format):
+    'BLOCKS message made of blocks encoded by encode_block(), so the blocks are not encoded again.'
+    if WireFormat.JSON == wire_format:
+        return '{{"type": {}, "from": "{}", "data": {{"length": {}, "blocks": ['.format(MsgType.BLOCKS, sender, chain_length).encode() \
+            + b', '.join(encoded_blocks) + b']}}'
+
+    w = BinaryWriter().raw(WireFormat.MAGIC).varint(wire_format).varint(MsgType.BLOCKS).hex(sender, 48)
+    return w.varint(chain_length).varint(len(encoded_blocks)).raw(b''.join(encoded_blocks)).to_bytes()
+
+
+def fragment_size(wire_format, datagram_size):
+    'The largest chunk of an encoded message, whose FRAGMENT message fits into a datagram of datagram_size.'
+    if WireFormat.JSON == wire_format:
+        return (datagram_size - 256) // 4 * 3 # chunks are in base64
+    return datagram_size - 128
+
+
+# msg type => (write data to BinaryWriter, read it from BinaryReader); an empty payload stands for None
+BINARY_CODECS = {
+    MsgType.STRONG_BLOCK_MINED : (lambda w, blk: blk.write_to(w), lambda node, r: Block.read_from(node, r)),
+    MsgType.WEAK_HEADER_MINED  : (lambda w, wh: wh.write_delta_to(w.hex(wh.prev_hash, 32)), lambda node, r: Header.read_delta_from(r, r.hex(32), None)),
+    MsgType.TRANSACTION        : (lambda w, tx: tx.write_to(w), lambda node, r: Transaction.read_from(r)),
+    MsgType.GET_BLOCK          : (lambda w, length: w.varint(length), lambda node, r: r.varint()),
+    MsgType.BLOCK              : (lambda w, blk: blk.write_to(w), lambda node, r: Block.read_from(node, r)),
+    MsgType.GET_HEADERS        : (lambda w, length: w.varint(length), lambda node, r: r.varint()),
+    MsgType.HEADERS            : (write_blocks, read_blocks),
+    MsgType.GET_PROOF          : (lambda w, tx_hash: w.hex(tx_hash, 32), lambda node, r: r.hex(32)),
+    MsgType.PROOF              : (lambda w, proof: proof.write_to(w), lambda node, r: TxProof.read_from(r)),
+    MsgType.GET_BLOCK_BY_HASH  : (lambda w, block_hash: w.hex(block_hash, 32), lambda node, r: r.hex(32)),
+    MsgType.GET_BLOCKS         : (lambda w, rng: w.varint(rng[0]).varint(rng[1]), lambda node, r: (r.varint(), r.varint())),
+    MsgType.BLOCKS             : (lambda w, rep: write_blocks(w.varint(rep[0]), rep[1]), lambda node, r: (r.varint(), read_blocks(node, r))),
+    MsgType.COMPACT_BLOCK      : (lambda w, cb: cb.write_to(w), lambda node, r: CompactBlock.read_from(r)),
+    MsgType.GET_BLOCK_TXNS     : (lambda w, req: write_varints(write_varints(w.hex(req[0], 32), req[1]), req[2]),
+                                  lambda node, r: (r.hex(32), read_varints(r), read_varints(r))),
+    MsgType.BLOCK_TXNS         : (lambda w, rep: write_items(write_items(w.hex(rep[0], 32), rep[1]), rep[2]),
+                                  lambda node, r: (r.hex(32), [Header.read_from(r) for _ in range(r.varint())], [Transaction.read_from(r) for _ in range(r.varint())])),
+    MsgType.FRAGMENT           : (lambda w, f: w.varint(f[0]).varint(f[1]).varint(f[2]).bytes(f[3]),
+                                  lambda node, r: (r.varint(), r.varint(), r.varint(), r.bytes())),
+}
+
+# codecs of BINARY_V1 that differ from the current ones (weak headers with all their fields)
+BINARY_V1_CODECS = {
+    **BINARY_CODECS,
+    MsgType.STRONG_BLOCK_MINED : (lambda w, blk: blk.write_to(w, False), lambda node, r: Block.read_from(node, r, False)),
+    MsgType.WEAK_HEADER_MINED  : (lambda w, wh: wh.write_to(w), lambda node, r: Header.read_from(r)),
+    MsgType.BLOCK              : (lambda w, blk: blk.write_to(w, False), lambda node, r: Block.read_from(node, r, False)),
+    MsgType.HEADERS            : (lambda w, blks: write_blocks(w, blks, False), lambda node, r: read_blocks(node, r, False)),
+    MsgType.BLOCKS             : (lambda w, rep: write_blocks(w.varint(rep[0]), rep[1], False), lambda node, r: (r.varint(), read_blocks(node, r, False))),
+}
+
+def binary_codecs(version):
+    return BINARY_V1_CODECS if WireFormat.BINARY_V1 == version else BINARY_CODECS
+
+
+def encode_message(msg, wire_format):
+    'msg is a dict with type, from (sender key) and data (object of the message type or None).'
+
+    if WireFormat.JSON == wire_format or msg['type'] in WireFormat.HANDSHAKE:
+        data = msg['data']
+        return json.dumps({
+            'type' : msg['type'], 'from' : msg['from'],
+            'data' : JSON_CODECS[msg['type']][0](data) if data is not None else None
+        }).encode()
+
+    w = BinaryWriter().raw(WireFormat.MAGIC).varint(wire_format).varint(msg['type']).hex(msg['from'], 48)
+    if msg['data'] is not None:
+        binary_codecs(wire_format)[msg['type']][0](w, msg['data'])
+    return w.to_bytes()
+
+
+def decode_message(node, datagram):
+    'Inverse of encode_message(); raises ValueError (or BinaryFormatError) on malformed messages.'
+
+    if not datagram.startswith(WireFormat.MAGIC):
+        msg = json.loads(datagram)
+        if msg['type'] in JSON_CODECS and msg['data'] is not None:
+            msg['data'] = JSON_CODECS[msg['type']][1](node, msg['data'])
+        return msg
+
+    r = BinaryReader(datagram, len(WireFormat.MAGIC))
+    version, msg_type, sender = r.varint(), r.varint(), r.hex(48)
+    if not version in WireFormat.SUPPORTED or not msg_type in BINARY_CODECS:
+        raise ValueError("unsupported binary message (version {}, type {})".format(version, msg_type))
+
+    data = None if r.at_end() else binary_codecs(version)[msg_type][1](node, r)
+    return {'type' : msg_type, 'from' : sender, 'data' : data}